@@ -1,87 +1,1300 @@
-from lxml import html
-from datetime import datetime, timedelta
-from ebooklib import epub
-import requests
+from datetime import datetime, timedelta, timezone
 import os
+import random
 import re
-from urllib.parse import quote
-import webbrowser
-from tkinter import Tk, Frame, Button, messagebox, ttk
-from tkcalendar import Calendar
+import sys
+from urllib.parse import quote, unquote, urljoin, urlsplit
 import threading
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+import argparse
 import base64
+import copy
+import functools
+import hashlib
+import importlib
+import io
+import json
+import queue
+import shutil
+import sqlite3
 import tempfile
+import time
+import zipfile
+import zlib
 
-def fetch_articles(custom_date=None):
-    articles_data = []
-    today = custom_date if custom_date else datetime.now().strftime('%Y-%m/%d')
-    date_obj = datetime.strptime(today, "%Y-%m/%d")
-    if date_obj >= datetime(2024, 12, 1):
+# 较重的第三方库在首次使用时才导入：查看帮助、全文检索等不需要网络和解析库，命令行运行也不会加载Tk。
+# 首次访问属性时导入模块，并把模块级的同名变量替换为真正的模块，之后的访问不再经过代理
+class _LazyModule:
+    def __init__(self, global_name, module_name):
+        self._global_name = global_name
+        self._module_name = module_name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._module_name)
+        globals()[self._global_name] = module
+        return getattr(module, attr)
+
+html = _LazyModule('html', 'lxml.html')
+etree = _LazyModule('etree', 'lxml.etree')
+epub = _LazyModule('epub', 'ebooklib.epub')
+requests = _LazyModule('requests', 'requests')
+webbrowser = _LazyModule('webbrowser', 'webbrowser')
+saxutils = _LazyModule('saxutils', 'xml.sax.saxutils')  # 会连带导入urllib.request
+
+def _load_gui():
+    # 打开图形界面时才导入tkinter与tkcalendar
+    global Tk, Frame, Button, Label, BooleanVar, messagebox, ttk, Calendar
+    from tkinter import Tk, Frame, Button, Label, BooleanVar, messagebox, ttk
+    from tkcalendar import Calendar
+
+MAX_WORKERS = 8                 # 文章页并发下载线程数
+MAX_PER_HOST = 4                # 同一主机的最大并发请求数
+REQUEST_TIMEOUT = (5, 20)       # (连接超时, 读取超时)，单位秒
+MAX_RETRIES = 3                 # 5xx/连接中断时的最大重试次数
+RETRY_BACKOFF = 0.5             # 指数退避基数，依次等待 0.5、1、2 秒……
+RETRY_STATUS = {429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}    # 服务器限流时返回的状态码，收到后降低请求速率
+RATE_LIMIT = 10.0               # 每个主机的平均请求速率上限(次/秒)
+RATE_BURST = 4                  # 令牌桶容量，允许的短时突发请求数
+MIN_RATE = 0.5                  # 限流降速的下限(次/秒)
+RATE_RECOVERY = 0.05            # 每次成功的请求把速率恢复设定值的5%
+RATE_JITTER = 0.2               # 等待时间附加的随机抖动比例
+RETRY_AFTER_MAX = 300           # Retry-After的上限(秒)
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.pdec', 'http_cache')  # 网页缓存目录
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # 缓存上限，超出后按最近最少使用淘汰
+
+# 报纸的版面页和文章页在出版当天结束后不再变化，此后获取的缓存命中时无需向服务器确认；
+# 当天获取的缓存可能是发布过程中不完整或之后被修改的内容，仍需确认
+_IMMUTABLE_URL_PATTERNS = [
+    re.compile(r'/rmrb/html/(\d{4})-(\d{2})/(\d{2})/'),
+    re.compile(r'/rmrb/pc/(?:layout|content)/(\d{4})(\d{2})/(\d{2})/'),
+]
+
+def issue_day_end(today):
+    # 某期(日期字符串如 2024-12/01)出版当天结束的时刻
+    return datetime.strptime(today, '%Y-%m/%d') + timedelta(days=1)
+
+def _is_immutable(url, fetched_at):
+    # fetched_at为缓存条目的获取时间(时间戳)，旧版本写入的条目没有记录，按需要确认处理
+    if fetched_at is None:
+        return False
+    for pattern in _IMMUTABLE_URL_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return datetime.fromtimestamp(fetched_at) >= datetime(*map(int, match.groups())) + timedelta(days=1)
+    return False
+
+# 以URL的哈希为键的磁盘缓存，保存正文与ETag/Last-Modified；文件修改时间记录最近访问时间，用于LRU淘汰
+class ResponseCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith('.body'))
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.body'), os.path.join(self.directory, key + '.json')
+
+    def get(self, url):
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        if len(body) != meta.get('size', len(body)):  # 正文与元数据不是同一次写入的
+            return None
+        return meta, body
+
+    def __contains__(self, url):
+        return os.path.exists(self._paths(url)[0])
+
+    def touch(self, url):
+        try:
+            os.utime(self._paths(url)[1])
+        except OSError:
+            pass
+
+    def validated(self, url, meta):
+        # 服务器确认缓存仍然有效(304)时更新获取时间
+        meta_path = self._paths(url)[1]
+        with self._lock:
+            with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(dict(meta, fetched_at=round(time.time(), 3)), f)
+            os.replace(meta_path + '.tmp', meta_path)
+
+    def put(self, url, response):
+        body_path, meta_path = self._paths(url)
+        meta = {'url': url, 'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified'),
+                'size': len(response.content), 'fetched_at': round(time.time(), 3)}
+        with self._lock:
+            old_size = os.path.getsize(body_path) if os.path.exists(body_path) else 0
+            # 先写临时文件再替换，中断或并发读取时不会读到截断的正文
+            with open(body_path + '.tmp', 'wb') as f:
+                f.write(response.content)
+            with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(body_path + '.tmp', body_path)
+            os.replace(meta_path + '.tmp', meta_path)
+            self._size += len(response.content) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # 从最久未访问的条目开始删除，直到降到上限的90%
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')),
+                         key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            body_path = entry.path[:-5] + '.body'
+            try:
+                self._size -= os.path.getsize(body_path)
+                os.remove(body_path)
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+def _cached_response(url, body):
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = body
+    response.from_cache = True
+    return response
+
+# 下载流程的计时与计数：每次请求的连接耗时、首字节时间、总耗时和字节数，各阶段(fetch/parse/build/write)的耗时，
+# 以及重试、去重、失败等计数。事件通过回调通知(如图形界面的进度条)，并可写入JSON Lines跟踪文件或导出Prometheus文本格式
+class Metrics:
+    def __init__(self, trace_path=None):
+        self.counters = {}
+        self.request_totals = {'count': 0, 'bytes': 0, 'seconds': 0.0, 'ttfb_seconds': 0.0,
+                               'connections': 0, 'connect_seconds': 0.0}
+        self.stage_totals = {}  # 阶段名 → [次数, 总耗时]
+        self.hooks = []
+        self._lock = threading.Lock()
+        self._trace = open(trace_path, 'a', encoding='utf-8') if trace_path else None
+
+    def add_hook(self, callback):
+        # callback(event) 在产生事件的线程中调用，event为包含 event 字段的字典
+        self.hooks.append(callback)
+
+    def emit(self, event, **fields):
+        fields = dict(event=event, time=round(time.time(), 6), **fields)
+        for hook in self.hooks:
+            hook(fields)
+        if self._trace is not None:
+            with self._lock:
+                self._trace.write(json.dumps(fields, ensure_ascii=False) + '\n')
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_request(self, url, status, connect, ttfb, total, size):
+        with self._lock:
+            totals = self.request_totals
+            totals['count'] += 1
+            totals['bytes'] += size
+            totals['seconds'] += total
+            totals['ttfb_seconds'] += ttfb
+            if connect:
+                totals['connections'] += 1
+                totals['connect_seconds'] += connect
+        self.emit('request', url=url, status=status, connect=round(connect, 6), ttfb=round(ttfb, 6),
+                  total=round(total, 6), bytes=size)
+
+    @contextmanager
+    def span(self, stage, **fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                totals = self.stage_totals.setdefault(stage, [0, 0.0])
+                totals[0] += 1
+                totals[1] += seconds
+            self.emit('span', stage=stage, seconds=round(seconds, 6), **fields)
+
+    def prometheus(self):
+        lines = []
+
+        def metric(name, kind, samples):
+            lines.append(f'# TYPE pdec_{name} {kind}')
+            lines.extend(f'pdec_{name}{labels} {value}' for labels, value in samples)
+
+        with self._lock:
+            totals = dict(self.request_totals)
+            stages = {stage: list(values) for stage, values in self.stage_totals.items()}
+            counters = dict(self.counters)
+        metric('http_responses_total', 'counter', [('', totals['count'])])
+        metric('http_response_bytes_total', 'counter', [('', totals['bytes'])])
+        metric('http_response_seconds_total', 'counter', [('', totals['seconds'])])
+        metric('http_ttfb_seconds_total', 'counter', [('', totals['ttfb_seconds'])])
+        metric('http_connections_total', 'counter', [('', totals['connections'])])
+        metric('http_connect_seconds_total', 'counter', [('', totals['connect_seconds'])])
+        metric('stage_seconds', 'summary',
+               [(f'_sum{{stage="{stage}"}}', values[1]) for stage, values in sorted(stages.items())] +
+               [(f'_count{{stage="{stage}"}}', values[0]) for stage, values in sorted(stages.items())])
+        for name, value in sorted(counters.items()):
+            metric(f'{name}_total', 'counter', [('', value)])
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+# 记录新建连接(DNS解析、TCP握手及TLS握手)的耗时；连接在发起请求的线程中建立，因此用线程局部变量传回
+_connect_timing = threading.local()
+
+@functools.lru_cache(maxsize=None)
+def _timed_adapter_class():
+    # 以requests/urllib3的类为基类，首次建立HttpClient时才定义
+    import urllib3
+    from requests.adapters import HTTPAdapter
+
+    class TimedHTTPConnection(urllib3.connection.HTTPConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            _connect_timing.seconds = getattr(_connect_timing, 'seconds', 0.0) + time.perf_counter() - start
+
+    class TimedHTTPSConnection(urllib3.connection.HTTPSConnection):
+        def connect(self):
+            start = time.perf_counter()
+            super().connect()
+            _connect_timing.seconds = getattr(_connect_timing, 'seconds', 0.0) + time.perf_counter() - start
+
+    class TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+
+    class TimedHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool,
+                                                       'https': TimedHTTPSConnectionPool}
+
+    return TimedHTTPAdapter
+
+# 每个主机一个令牌桶，限制平均请求速率。收到429/503时速率减半，并遵守Retry-After暂停该主机，
+# 之后每次成功的请求逐步恢复到设定速率(加性增、乘性减)；等待时间附加随机抖动，避免各线程同时醒来
+class RateLimiter:
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, host_rates=None, jitter=RATE_JITTER):
+        self.rate = rate                    # 未单独设置的主机使用的速率(次/秒)，0表示不限速
+        self.burst = burst
+        self.host_rates = dict(host_rates or {})
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, url):
+        # 调用时须持有_lock
+        host = urlsplit(url).netloc
+        if host not in self._hosts:
+            rate = self.host_rates.get(host.split(':')[0], self.rate)
+            self._hosts[host] = {'max_rate': rate, 'rate': rate, 'tokens': self.burst, 'updated': time.monotonic(),
+                                 'blocked_until': 0.0, 'requests': 0, 'first': None, 'last': None, 'slowdowns': 0}
+        return self._hosts[host]
+
+    def acquire(self, url, cancel=None):
+        # cancel为threading.Event，等待期间被设置时抛出Cancelled
+        while True:
+            with self._lock:
+                bucket = self._host(url)
+                now = time.monotonic()
+                if not bucket['max_rate']:
+                    wait = 0
+                else:
+                    if now > bucket['updated']:
+                        bucket['tokens'] = min(self.burst, bucket['tokens'] + (now - bucket['updated']) * bucket['rate'])
+                        bucket['updated'] = now
+                    wait = max(bucket['blocked_until'] - now, (1 - bucket['tokens']) / bucket['rate'], 0)
+                if wait <= 0:
+                    if bucket['max_rate']:
+                        bucket['tokens'] -= 1
+                    bucket['requests'] += 1
+                    bucket['first'] = bucket['first'] or now
+                    bucket['last'] = now
+                    return
+            _sleep(wait * (1 + random.uniform(0, self.jitter)), cancel)
+
+    def feedback(self, url, status_code, retry_after=None):
+        # 根据响应调整该主机的速率；返回是否因限流而降速
+        with self._lock:
+            bucket = self._host(url)
+            if not bucket['max_rate']:
+                return False
+            if status_code in THROTTLE_STATUS:
+                bucket['rate'] = max(bucket['rate'] / 2, MIN_RATE)
+                bucket['slowdowns'] += 1
+                if retry_after:
+                    bucket['blocked_until'] = max(bucket['blocked_until'], time.monotonic() + retry_after)
+                # 清空令牌，暂停结束后不会立即突发请求
+                bucket['tokens'] = 0
+                bucket['updated'] = max(bucket['updated'], bucket['blocked_until'], time.monotonic())
+                return True
+            if status_code < 400:
+                bucket['rate'] = min(bucket['rate'] + bucket['max_rate'] * RATE_RECOVERY, bucket['max_rate'])
+            return False
+
+    def summary(self):
+        # 各主机的实际请求速率(请求数/首末请求的间隔)及降速情况
+        parts = []
+        with self._lock:
+            for host, bucket in self._hosts.items():
+                if not bucket['requests']:
+                    continue
+                elapsed = bucket['last'] - bucket['first']
+                rate = f'{bucket["requests"] / elapsed:.1f} 次/秒' if elapsed > 0 else '-'
+                text = f'{host} 实际速率 {rate}'
+                if bucket['slowdowns']:
+                    text += f'(因限流降速 {bucket["slowdowns"]} 次，当前上限 {bucket["rate"]:.1f} 次/秒)'
+                parts.append(text)
+        return '；'.join(parts)
+
+def _retry_after(response):
+    # Retry-After可以是秒数或HTTP日期，结果限制在RETRY_AFTER_MAX秒以内
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        from email.utils import parsedate_to_datetime
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), RETRY_AFTER_MAX)
+
+class Cancelled(Exception):
+    pass
+
+def _sleep(seconds, cancel=None):
+    if cancel is None:
+        time.sleep(seconds)
+    elif cancel.wait(seconds):
+        raise Cancelled()
+
+# 同一进程中未指定限速器的HttpClient共用的限速器
+default_rate_limiter = RateLimiter()
+
+# 共享的HTTP会话：连接池复用(keep-alive)、超时、指数退避重试、按主机限速，并统计本次运行的请求情况
+class HttpClient:
+    def __init__(self, max_workers=MAX_WORKERS, max_per_host=MAX_PER_HOST, timeout=REQUEST_TIMEOUT,
+                 max_retries=MAX_RETRIES, backoff=RETRY_BACKOFF, cache=None, revalidate=False, metrics=None,
+                 rate_limiter=None):
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else default_rate_limiter
+        self.cancel = None
+        self.revalidate = revalidate  # 为True时，非往期页面的缓存需用条件请求向服务器确认后才使用
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_per_host = max_per_host
+        self.session = requests.Session()
+        adapter = _timed_adapter_class()(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'cache_hits': 0, 'throttled': 0}
+        self._lock = threading.Lock()
+        self._host_semaphores = {}
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._host_semaphores[host]
+
+    @contextmanager
+    def _host_slot(self, url):
+        # 分段等待同一主机的并发名额，等待期间被取消时及时退出
+        semaphore = self._host_semaphore(url)
+        while not semaphore.acquire(timeout=0.1):
+            if self.cancel is not None and self.cancel.is_set():
+                raise Cancelled()
+        try:
+            if self.cancel is not None and self.cancel.is_set():
+                raise Cancelled()
+            yield
+        finally:
+            semaphore.release()
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+        self.metrics.count(key)
+
+    def cancellable(self, cancel):
+        # 返回与本客户端共用连接池、缓存、限速和统计的副本；cancel(threading.Event)被设置后，
+        # 副本尚未发出的请求、重试和等待都立即以Cancelled结束，已发出的请求最多等到超时
+        client = copy.copy(self)
+        client.cancel = cancel
+        return client
+
+    def get(self, url, revalidate=None, **kwargs):
+        if self.cancel is not None and self.cancel.is_set():
+            raise Cancelled()
+        if self.cache is None:
+            return self._fetch(url, **kwargs)
+
+        revalidate = self.revalidate if revalidate is None else revalidate
+        cached = self.cache.get(url)
+        if cached is not None:
+            meta, body = cached
+            if not revalidate or _is_immutable(url, meta.get('fetched_at')):
+                self._count('cache_hits')
+                return _cached_response(url, body)
+            headers = kwargs.setdefault('headers', {})
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self._fetch(url, **kwargs)
+        if response.status_code == 304 and cached is not None:
+            self._count('cache_hits')
+            self.cache.validated(url, cached[0])
+            return _cached_response(url, cached[1])
+        self.cache.put(url, response)
+        return response
+
+    def head(self, url, **kwargs):
+        # HEAD请求不读缓存也不写缓存，只用于探测页面是否存在
+        if self.cancel is not None and self.cancel.is_set():
+            raise Cancelled()
+        kwargs.setdefault('allow_redirects', True)
+        return self._fetch(url, method='HEAD', **kwargs)
+
+    def _fetch(self, url, method='GET', **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            if self.cancel is not None and self.cancel.is_set():
+                raise Cancelled()
+            self._count('requests')
+            try:
+                # 限制同一主机的请求速率和并发数，避免批量下载时对服务器造成压力
+                self.rate_limiter.acquire(url, self.cancel)
+                with self._host_slot(url):
+                    _connect_timing.seconds = 0.0
+                    start = time.perf_counter()
+                    response = self.session.request(method, url, **kwargs)
+                    self.metrics.record_request(url, response.status_code, _connect_timing.seconds,
+                                                response.elapsed.total_seconds(), time.perf_counter() - start,
+                                                len(response.content))
+                retry_after = _retry_after(response)
+                if self.rate_limiter.feedback(url, response.status_code, retry_after):
+                    self._count('throttled')
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response
+                error = requests.HTTPError(f'{response.status_code} Server Error: {url}', response=response)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                error = e
+            except requests.RequestException:
+                self._count('failures')
+                raise
+            if attempt == self.max_retries:
+                self._count('failures')
+                raise error
+            self._count('retries')
+            # 有Retry-After时由限速器暂停该主机，这里只做指数退避
+            _sleep(self.backoff * 2 ** attempt, self.cancel)
+
+    def summary(self):
+        summary = (f'共请求 {self.stats["requests"]} 次，重试 {self.stats["retries"]} 次，'
+                   f'失败 {self.stats["failures"]} 次，缓存命中 {self.stats["cache_hits"]} 次')
+        rates = self.rate_limiter.summary()
+        return f'{summary}；{rates}' if rates else summary
+
+    def close(self):
+        self.session.close()
+
+IMAGE_MEDIA_TYPES = {'.jpg': 'image/jpeg', '.jpeg': 'image/jpeg', '.png': 'image/png', '.gif': 'image/gif',
+                     '.webp': 'image/webp'}
+
+def _recompress_image(data, max_dimension=None, grayscale=False, quality=85):
+    # 在进程池中运行：缩小尺寸、转为灰度并重新编码为JPEG，适合墨水屏阅读器
+    from io import BytesIO
+    from PIL import Image
+    image = Image.open(BytesIO(data))
+    if max_dimension and max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension))
+    image = image.convert('L' if grayscale else 'RGB')
+    output = BytesIO()
+    image.save(output, 'JPEG', quality=quality or 85, optimize=True)
+    return output.getvalue()
+
+def image_options_from_args(args):
+    # 命令行的配图选项(ImageStore的关键字参数)；需要压缩时建立整个运行期间共用的进程池，
+    # 各期的ImageStore都使用它，用完后由调用方通过close_image_options关闭
+    if not args.images:
+        return None
+    options = {'max_dimension': args.image_max_size, 'grayscale': args.grayscale, 'quality': args.jpeg_quality}
+    if any(options.values()):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            return options  # ImageStore会提示安装Pillow
+        from concurrent.futures import ProcessPoolExecutor
+        options['process_pool'] = ProcessPoolExecutor()
+    return options
+
+def close_image_options(options):
+    if options is not None and options.get('process_pool') is not None:
+        options['process_pool'].shutdown()
+
+# 一期(或一本合集)的配图：经共享的HttpClient并发下载，按内容哈希去重，可选在进程池中压缩，
+# 等待写入EPUB的图片暂存在pending中，写入后即释放。未传入process_pool时自行建立进程池并在close时关闭
+class ImageStore:
+    def __init__(self, client, max_workers=MAX_WORKERS, max_dimension=None, grayscale=False, quality=None,
+                 process_pool=None):
+        self.client = client
+        self.recompress = bool(max_dimension or grayscale or quality)
+        self.options = (max_dimension, grayscale, quality)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._process_pool = process_pool
+        self._owns_process_pool = False
+        self._lock = threading.Lock()
+        self._by_url = {}     # 图片URL → EPUB内文件名
+        self._by_hash = {}    # 原始内容哈希 → EPUB内文件名
+        self._written = set()
+        self.pending = []     # [(文件名, 数据, 媒体类型)]
+        if self.recompress:
+            try:
+                import PIL  # noqa: F401
+            except ImportError:
+                print('未安装Pillow，图片将按原样嵌入（pip install pillow）')
+                self.recompress = False
+            else:
+                if self._process_pool is None:
+                    from concurrent.futures import ProcessPoolExecutor
+                    self._process_pool = ProcessPoolExecutor()
+                    self._owns_process_pool = True
+
+    def fetch_all(self, urls):
+        return list(self._executor.map(self._fetch, urls))
+
+    def _fetch(self, url):
+        with self._lock:
+            if url in self._by_url:
+                return self._by_url[url]
+        try:
+            data = self.client.get(url).content
+        except requests.RequestException as e:
+            print(f'获取图片时出错: {e}')
+            return None
+
+        digest = hashlib.sha1(data).hexdigest()[:16]
+        with self._lock:
+            if digest in self._by_hash:
+                self._by_url[url] = self._by_hash[digest]
+                return self._by_url[url]
+        if self.recompress:
+            try:
+                data = self._process_pool.submit(_recompress_image, data, *self.options).result()
+                extension = '.jpg'
+            except Exception as e:
+                print(f'压缩图片时出错，按原样嵌入: {e}')
+                extension = os.path.splitext(urlsplit(url).path)[1].lower()
+        else:
+            extension = os.path.splitext(urlsplit(url).path)[1].lower()
+        if extension not in IMAGE_MEDIA_TYPES:
+            extension = '.jpg'
+        name = f'images/{digest}{extension}'
+        self.add_existing(name, data)
+        with self._lock:
+            self._by_hash[digest] = self._by_url[url] = name
+        return name
+
+    def add_existing(self, name, data):
+        with self._lock:
+            if name in self._written:
+                return
+            self._written.add(name)
+            self.pending.append((name, data, IMAGE_MEDIA_TYPES[os.path.splitext(name)[1]]))
+
+    def pop_pending(self, content=None):
+        # content不为None时只取出正文中引用到的图片，按在正文中出现的顺序排列
+        with self._lock:
+            if content is None:
+                pending, self.pending = self.pending, []
+                return pending
+            positions = [content.find(item[0]) for item in self.pending]
+            used = sorted((position, item) for position, item in zip(positions, self.pending) if position >= 0)
+            self.pending = [item for position, item in zip(positions, self.pending) if position < 0]
+        return [item for _, item in used]
+
+    def discard_pending(self):
+        # 丢弃没有被任何已写入文章引用的图片(所属文章因重复被去掉或获取失败)，不写入EPUB；
+        # 同时忘记这些图片的URL和哈希，之后的文章再引用时重新获取(通常命中网页缓存)
+        with self._lock:
+            names = {item[0] for item in self.pending}
+            self.pending = []
+            self._written -= names
+            self._by_url = {url: name for url, name in self._by_url.items() if name not in names}
+            self._by_hash = {digest: name for digest, name in self._by_hash.items() if name not in names}
+
+    def close(self):
+        self._executor.shutdown()
+        if self._owns_process_pool:
+            self._process_pool.shutdown()
+
+PARTIAL_PARSE = True  # 文章页只解析正文所在的片段，跳过页头、导航等无关部分
+
+_CHARSET_PATTERN = re.compile(rb'''<meta[^>]+charset=["']?([\w-]+)''', re.I)
+_thread_parsers = threading.local()
+
+def _parse_from_marker(content, markers):
+    # 从最早出现的标记处截取并解析；截掉了<head>中的charset声明，因此先取出编码再交给解析器
+    starts = [index for index in (content.find(marker) for marker in markers) if index >= 0]
+    if not starts:
+        return html.fromstring(content)
+    start = min(starts)
+    match = _CHARSET_PATTERN.search(content, 0, start)
+    encoding = match.group(1).decode('ascii').lower() if match else 'utf-8'
+    parsers = _thread_parsers.__dict__.setdefault('parsers', {})
+    if encoding not in parsers:
+        parsers[encoding] = html.HTMLParser(encoding=encoding)
+    return html.fromstring(content[start:], parser=parsers[encoding])
+
+SITE_ROOT = os.environ.get('PDEC_SITE_ROOT')  # 设置后替换官网地址，用于本地测试站点和性能测试
+
+# 预编译的XPath，首次调用时才编译(导入本模块时不加载lxml)
+class _LazyXPath:
+    def __init__(self, expression):
+        self.expression = expression
+        self._compiled = None
+
+    def __call__(self, *args, **kwargs):
+        if self._compiled is None:
+            self._compiled = etree.XPath(self.expression)
+        return self._compiled(*args, **kwargs)
+
+# 官网某一时期的版式：负责拼接URL并持有预编译的XPath。官网再次改版时新增一个子类并加入LAYOUTS即可
+class Layout:
+    since = None
+    root = 'http://paper.people.com.cn'
+    index_page = None
+    section_links = _LazyXPath('/html/body/div[2]/div[2]/div[2]/div/div/a')
+    article_links = _LazyXPath('/html/body/div[2]/div[2]/div[3]/ul/li/a')
+    paragraphs = _LazyXPath('//div[@id="ozoom"]/p')
+    figure_tables = _LazyXPath('//table[@class="pci_c"]')
+    figure_captions = _LazyXPath('.//td[@class="font_s"]')
+    article_markers = (b'<table class="pci_c"', b'<div id="ozoom"')
+
+    def base_url(self, today):
+        raise NotImplementedError
+
+    def index_url(self, today):
+        return self.base_url(today) + self.index_page
+
+    def parse_index(self, content, base_url):
+        # 返回 [(版面名, 版面URL)]，版面名取“第01版：要闻”冒号后的部分
+        return [(section.text_content().split('：')[-1], base_url + section.get('href').lstrip('./'))
+                for section in self.section_links(html.fromstring(content))]
+
+    def parse_section(self, content, base_url):
+        return [(article.text_content().strip(), base_url + article.get('href'))
+                for article in self.article_links(html.fromstring(content))]
+
+    def parse_article(self, content, article_url, images=None):
+        doc = _parse_from_marker(content, self.article_markers) if PARTIAL_PARSE else html.fromstring(content)
+        article_paragraphs = self.paragraphs(doc)
+        figures = ''
+        if images is not None:
+            figures = self._embed_images(doc, article_paragraphs, article_url, images)
+        return figures + ''.join([f'<p>{html.tostring(p, encoding=str, method="html", with_tail=False).strip()}</p>' for p in article_paragraphs])
+
+    def _embed_images(self, doc, article_paragraphs, article_url, images):
+        # 文章配图位于正文前的 table.pci_c 中(下方为图片说明)，正文段落内也可能有<img>；
+        # 统一下载后把src改写为EPUB内的相对路径，下载失败的图片直接去掉
+        inline_images = [img for p in article_paragraphs for img in p.iter('img')]
+        figure_images = [(img, table) for table in self.figure_tables(doc) for img in table.iter('img')]
+        names = images.fetch_all([urljoin(article_url, img.get('src', ''))
+                                  for img in inline_images + [img for img, _ in figure_images]])
+
+        for img, name in zip(inline_images, names):
+            if name:
+                img.set('src', name)
+            else:
+                img.drop_tree()
+
+        figures = []
+        for (img, table), name in zip(figure_images, names[len(inline_images):]):
+            if not name:
+                continue
+            caption = ' '.join(td.text_content().strip() for td in self.figure_captions(table)).strip()
+            figures.append(f'<p><img src={saxutils.quoteattr(name)} alt={saxutils.quoteattr(caption)}/></p>')
+            if caption:
+                figures.append(f'<p><small>{saxutils.escape(caption)}</small></p>')
+        return ''.join(figures)
+
+# 2024年12月1日改版前：http://paper.people.com.cn/rmrb/html/2024-11/30/nbs.D110000renmrb_01.htm
+class LegacyLayout(Layout):
+    since = datetime(2022, 1, 1)
+    index_page = 'nbs.D110000renmrb_01.htm'
+
+    def base_url(self, today):
+        return f'{SITE_ROOT or self.root}/rmrb/html/{today}/'
+
+# 2024年12月1日改版后：https://paper.people.com.cn/rmrb/pc/layout/202412/01/node_01.html
+class PcLayout(Layout):
+    since = datetime(2024, 12, 1)
+    root = 'https://paper.people.com.cn'
+    index_page = 'node_01.html'
+
+    def base_url(self, today):
         year_month = today.replace("-", "")[:6]  # 2024-12/01 → 202412
         day = today[-2:]
-        base_url = f'https://paper.people.com.cn/rmrb/pc/layout/{year_month}/{day}/'
-        index_page = 'node_01.html'
-    else:
-        base_url = f'http://paper.people.com.cn/rmrb/html/{today}/' 
-        index_page = 'nbs.D110000renmrb_01.htm'
+        return f'{SITE_ROOT or self.root}/rmrb/pc/layout/{year_month}/{day}/'
 
+LAYOUTS = [PcLayout(), LegacyLayout()]  # 按启用日期从新到旧排列
+
+def get_layout(today):
+    date_obj = datetime.strptime(today, "%Y-%m/%d")
+    for layout in LAYOUTS:
+        if date_obj >= layout.since:
+            return layout
+    return LAYOUTS[-1]
+
+# 一篇文章的记录。版面名经sys.intern，同一版面的文章共用一个字符串；正文可以放在ArticleSpool中，
+# 此时body为(偏移, 长度)，读取content时才从临时文件取出。其他版面已收录的重复文章body为None，filename为首次出现处的文件名
+@dataclass(slots=True)
+class Article:
+    section: str
+    title: str
+    body: object
+    filename: str
+    spool: object = None
+
+    @property
+    def content(self):
+        if self.spool is None or self.body is None:
+            return self.body
+        return self.spool.read(self.body)
+
+    @property
+    def is_reference(self):
+        return self.body is None
+
+# 把文章正文依次追加到匿名临时文件，内存中只保留各篇的(偏移, 长度)；生成EPUB时逐篇读出
+class ArticleSpool:
+    def __init__(self, directory=None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._lock = threading.Lock()
+        self._size = 0
+
+    def write(self, content):
+        data = content.encode('utf-8')
+        with self._lock:
+            self._file.seek(self._size)
+            self._file.write(data)
+            offset = self._size
+            self._size += len(data)
+        return offset, len(data)
+
+    def read(self, ref):
+        offset, length = ref
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length).decode('utf-8')
+
+    def close(self):
+        self._file.close()
+
+# 正文规范化：官网正文中每个<p>都带有内联样式和全角空格缩进，parse_article又在外面再包一层<p>，
+# 阅读器解析时会多出空段落。规范化后只保留段落结构、图片和少量语义标签
+_PRESENTATIONAL_ATTRIBUTES = {'style', 'class', 'id', 'align', 'valign', 'width', 'height', 'border', 'bgcolor',
+                              'color', 'face', 'size', 'lang', 'dir'}
+_SIMPLE_TAGS = {'p', 'img', 'br', 'b', 'strong', 'i', 'em', 'small', 'sub', 'sup', 'a'}  # 简化标记时保留的标签
+_SPACE_RUN = re.compile(r'[\s\u3000]+')
+# 紧跟在汉字后的半角标点改为全角，只在其后是空白、汉字、引号或结尾时转换，不影响数字和网址中的标点
+_HALFWIDTH_PUNCTUATION = re.compile(r'(?<=[\u3400-\u4dbf\u4e00-\u9fff])[,;:?!](?=[\s\u3400-\u4dbf\u4e00-\u9fff“”‘’]|$)')
+_FULLWIDTH = {',': '，', ';': '；', ':': '：', '?': '？', '!': '！'}
+_SPACE_AFTER_FULLWIDTH = re.compile(r'(?<=[，。、；：？！）》」』])\s+')  # 全角标点自带间距，其后的空白是多余的
+
+def _normalize_text(text):
+    if not text:
+        return text
+    text = _SPACE_RUN.sub(' ', text)
+    text = _HALFWIDTH_PUNCTUATION.sub(lambda match: _FULLWIDTH[match.group()], text)
+    return _SPACE_AFTER_FULLWIDTH.sub('', text)
+
+def normalize_article(content, simple=False):
+    # 展平嵌套的段落，去掉样式等表现性属性和<font>/<span>，合并空白(含全角空格)并去掉段首尾的空白，
+    # 汉字后的半角标点改为全角，删除空段落；simple为True时只保留_SIMPLE_TAGS中的标签，其他标签去掉外壳保留内容。
+    # 纯函数，可以在进程池中执行
+    root = html.fragment_fromstring(content, create_parent='div')
+    for p in [p for p in root.iter('p') if p.find('.//p') is not None]:
+        p.drop_tag()
+    for element in list(root.iter()):
+        if element is root or not isinstance(element.tag, str):
+            continue
+        for name in [name for name in element.attrib if name in _PRESENTATIONAL_ATTRIBUTES or name.startswith('on')]:
+            del element.attrib[name]
+        if element.tag in ('font', 'span') or (simple and element.tag not in _SIMPLE_TAGS):
+            element.drop_tag()
+    for element in root.iter():
+        if isinstance(element.tag, str):
+            element.text = _normalize_text(element.text)
+        if element is not root:
+            element.tail = _normalize_text(element.tail)
+    for p in list(root.iter('p')):
+        if p.text:
+            p.text = p.text.lstrip()
+        last = p[-1] if len(p) else None
+        if last is not None and last.tail:
+            last.tail = last.tail.rstrip()
+        elif last is None and p.text:
+            p.text = p.text.rstrip()
+        if not p.text_content().strip() and p.find('.//img') is None:
+            p.drop_tree()
+    return (saxutils.escape(root.text.strip()) if root.text and root.text.strip() else '') + ''.join(
+        html.tostring(child, encoding=str, method='html', with_tail=False)
+        + (saxutils.escape(child.tail.strip()) if child.tail and child.tail.strip() else '') for child in root)
+
+# 对文章正文做规范化。processes大于0时在进程池中执行：下载线程提交后等待结果，
+# 一篇文章的规范化与其他线程的网络请求同时进行，不占用本进程的GIL
+class Normalizer:
+    def __init__(self, simple=False, processes=0):
+        self.simple = simple
+        self.markup = 'simple' if simple else 'normalized'  # 记入清单，规范化方式不同的旧章节不复用
+        self._process_pool = None
+        if processes:
+            from concurrent.futures import ProcessPoolExecutor
+            self._process_pool = ProcessPoolExecutor(processes)
+
+    def __call__(self, content):
+        if self._process_pool is None:
+            return normalize_article(content, self.simple)
+        return self._process_pool.submit(normalize_article, content, self.simple).result()
+
+    def close(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+
+def _fetch_article_links(client, layout, section_url, base_url):
+    content = client.get(section_url).content
+    with client.metrics.span('parse', url=section_url):
+        return layout.parse_section(content, base_url)
+
+def _fetch_article_content(client, layout, article_url, images=None, normalizer=None):
+    return _parse_article_content(client, layout, article_url, client.get(article_url).content, images, normalizer)
+
+def _parse_article_content(client, layout, article_url, content, images=None, normalizer=None):
+    with client.metrics.span('parse', url=article_url):
+        article_content = layout.parse_article(content, article_url, images)
+    if normalizer is None:
+        return article_content
+    with client.metrics.span('normalize', url=article_url):
+        return normalizer(article_content)
+
+def _revalidate_article(client, layout, article_title, article_url, previous, images=None, normalizer=None):
+    # 增量更新时确认上次下载的文章是否有变化：条件请求得到304(或往期页面命中缓存)时直接复用旧EPUB中的章节；
+    # 服务器返回了新页面时重新解析，内容摘要与清单中的相同仍复用旧章节，不同则返回新正文。请求出错时沿用旧章节
     try:
-        response = requests.get(base_url + index_page)
-        response.raise_for_status()
-    except requests.HTTPError:
-        print('页面未找到，请确认目标日期的《人民日报》（电子版）是否已发行，或检查系统日期。')
-        return articles_data, today
+        response = client.get(article_url, revalidate=True)
     except requests.RequestException as e:
-        print(f'网络请求出错: {e}')
-        return articles_data, today
+        print(f'确认文章是否更新时出错，沿用上次的内容: {e}')
+        response = None
+    if response is not None and not getattr(response, 'from_cache', False):
+        article_content = _parse_article_content(client, layout, article_url, response.content, images, normalizer)
+        if content_digest(article_title, article_content).hex() != previous.hash(article_url):
+            client.metrics.count('updated_articles')
+            return article_content
+    previous.reused.add(article_url)
+    client.metrics.count('reused_articles')
+    return previous.read(article_url, images)
 
-    doc = html.fromstring(response.content)
-    sections = doc.xpath('/html/body/div[2]/div[2]/div[2]/div/div/a')
-    
-    section_counter = 0  # 添加计数器初始化
-    unique_articles = set()  # 添加去重集合初始化
+def fetch_articles(custom_date=None, max_workers=MAX_WORKERS, client=None, images=None):
+    # 未传入共享的client时，本次调用单独建立一个带磁盘缓存的会话，结束后关闭并输出统计
+    if client is None:
+        client = HttpClient(max_workers=max_workers, cache=ResponseCache(), revalidate=True)
+        try:
+            return fetch_articles(custom_date, max_workers, client, images)
+        finally:
+            print(client.summary())
+            client.close()
+
+    today = custom_date if custom_date else datetime.now().strftime('%Y-%m/%d')
+    articles_data = list(iter_articles(today, client, max_workers, images=images))
+    return articles_data, today
 
-    for section in sections:
-        section_counter += 1
-        article_counter = 0  # 每个版块重置文章计数器
-        section_name = section.text_content().split('：')[-1]
-        section_url = base_url + section.get('href').lstrip('./')
+def iter_articles(today, client, max_workers=MAX_WORKERS, previous=None, manifest=None, images=None, spool=None,
+                  sections=None, section_numbers=None, normalizer=None, revalidate=False):
+    # 按版面、文章顺序逐篇产出Article，同时在下载中的文章页不超过 2*max_workers 篇。
+    # previous为上次生成的PreviousBuild，其中已有的文章直接复用不再请求；revalidate为True时这些文章先用条件请求确认，
+    # 有变化的重新下载(见_revalidate_article)；manifest不为None时填入本期的版面与文章清单，
+    # 以及获取失败的版面页和文章页(failures)；images为ImageStore时同时下载文章配图，正文中的图片引用改写为 images/ 下的文件；
+    # spool为ArticleSpool时正文写入临时文件，产出的Article只保留位置。
+    # sections为上次清单中的版面列表时不请求首页，已有文章链接的版面也不再请求，只重新获取上次失败的版面。
+    # section_numbers不为None时只处理其中的版面(从1开始的版次)，其他版面页和文章页都不请求，文件名仍按原版次编号；
+    # normalizer为Normalizer时新下载的正文经其规范化(复用的文章保持原样)
+    layout = get_layout(today)
+    base_url = layout.base_url(today)
+    metrics = client.metrics
 
+    if sections is None:
         try:
-            response = requests.get(section_url)
-            response.raise_for_status()
+            response = client.get(layout.index_url(today))
+        except requests.HTTPError:
+            print('页面未找到，请确认目标日期的《人民日报》（电子版）是否已发行，或检查系统日期。')
+            return
         except requests.RequestException as e:
-            print(f'获取文章链接时出错: {e}')
-            continue
+            print(f'网络请求出错: {e}')
+            return
+        sections = [{'name': section_name, 'url': section_url}
+                    for section_name, section_url in layout.parse_index(response.content, base_url)]
 
-        doc = html.fromstring(response.content)
-        articles = doc.xpath('/html/body/div[2]/div[2]/div[3]/ul/li/a')
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # 先并发请求所有版面页，再按版面顺序把文章页提交到线程池
+        section_futures = []
+        for section_counter, section in enumerate(sections, start=1):
+            if section_numbers is not None and section_counter not in section_numbers:
+                continue
+            if 'articles' in section:
+                future = Future()
+                future.set_result([tuple(link) for link in section['articles']])
+            else:
+                future = executor.submit(_fetch_article_links, client, layout, section['url'], base_url)
+            section_futures.append((section_counter, section['name'], section['url'], future))
 
-        for article in articles:
-            article_counter += 1
-            article_title = article.text_content().strip()
-            article_url = base_url + article.get('href')
+        if manifest is not None:
+            manifest.update(date=today, sections=[], articles=[], failures=[])
+        # 进度事件中的total为目前已知的文章数，随版面页陆续返回而增长
+        progress = {'done': 0, 'total': 0}
 
-            try:
-                response = requests.get(article_url)
-                response.raise_for_status()
-            except requests.RequestException as e:
-                print(f'获取文章内容时出错: {e}')
-                continue
+        def article_links():
+            for section_counter, section_name, section_url, future in section_futures:
+                section_name = sys.intern(section_name)
+                try:
+                    links = future.result()
+                except Cancelled:
+                    raise
+                except Exception as e:
+                    # 单个版面出错不影响其他版面，记入清单供之后补全
+                    print(f'获取文章链接时出错: {e}')
+                    metrics.count('section_failures')
+                    if manifest is not None:
+                        manifest['sections'].append({'name': section_name, 'url': section_url, 'error': str(e)})
+                        manifest['failures'].append({'kind': 'section', 'section': section_name, 'url': section_url,
+                                                     'error': str(e)})
+                    continue
+                if manifest is not None:
+                    manifest['sections'].append({'name': section_name, 'url': section_url,
+                                                 'articles': [list(link) for link in links]})
+                progress['total'] += len(links)
+                for article_counter, (article_title, article_url) in enumerate(links, start=1):
+                    yield section_name, article_title, f'{section_counter}_{article_counter}.xhtml', article_url
 
-            doc = html.fromstring(response.content)
-            
-            article_paragraphs = doc.xpath('//div[@id="ozoom"]/p')
-            article_content = ''.join([f'<p>{html.tostring(p, encoding=str, method="html", with_tail=False).strip()}</p>' for p in article_paragraphs])
-            article_signature = (section_name, article_title, article_content)
-            if article_signature in unique_articles:
+        # 按提交顺序收集结果，保证文件名与去重结果和顺序下载时一致。
+        # 同一URL只请求一次；重复出现在其他版面的文章以 content=None、filename=首次出现的文件名 产出，作为目录中的交叉引用
+        unique_articles = {}  # 内容摘要 → (版面名, 文件名)
+        emitted_urls = {}     # 文章URL → (版面名, 文件名)
+        submitted_urls = set()
+        pending = deque()
+        links = article_links()
+        while True:
+            for section_name, article_title, filename, article_url in links:
+                if article_url in submitted_urls:
+                    future = None
+                elif previous is not None and article_url in previous and revalidate:
+                    future = executor.submit(_revalidate_article, client, layout, article_title, article_url, previous,
+                                             images, normalizer)
+                elif previous is not None and article_url in previous:
+                    future = Future()
+                    future.set_result(previous.read(article_url, images))
+                    previous.reused.add(article_url)
+                    metrics.count('reused_articles')
+                else:
+                    future = executor.submit(_fetch_article_content, client, layout, article_url, images, normalizer)
+                submitted_urls.add(article_url)
+                pending.append((section_name, article_title, filename, article_url, future))
+                if len(pending) >= 2 * max_workers:
+                    break
+            if not pending:
+                break
+
+            section_name, article_title, filename, article_url, future = pending.popleft()
+            progress['done'] += 1
+            metrics.emit('progress', date=today, done=progress['done'], total=progress['total'])
+            if future is None:
+                original = emitted_urls.get(article_url)
+                if original is None:
+                    continue  # 首次出现时获取失败，已记入failures
+            else:
+                try:
+                    article_content = future.result()
+                except Cancelled:
+                    raise
+                except Exception as e:
+                    print(f'获取文章内容时出错: {e}')
+                    metrics.count('article_failures')
+                    if manifest is not None:
+                        manifest['failures'].append({'kind': 'article', 'section': section_name, 'title': article_title,
+                                                     'url': article_url, 'filename': filename, 'error': str(e)})
+                    continue
+                if previous is not None and article_url in previous.reused:
+                    digest = bytes.fromhex(previous.hash(article_url))
+                else:
+                    digest = content_digest(article_title, article_content)
+                original = unique_articles.get(digest)
+                if original is None:
+                    unique_articles[digest] = (section_name, filename)
+                emitted_urls[article_url] = original or (section_name, filename)
+
+            if original is not None:
+                # 同一版面内的重复直接丢弃，跨版面的重复保留为指向首次出现位置的目录项
+                metrics.count('duplicates')
+                if original[0] == section_name:
+                    continue
+                if manifest is not None:
+                    manifest['articles'].append({'section': section_name, 'title': article_title, 'url': article_url,
+                                                 'filename': original[1], 'duplicate': True})
+                yield Article(section_name, article_title, None, original[1])
                 continue
-            unique_articles.add(article_signature)
-            
-            filename = f'{section_counter}_{article_counter}.xhtml'
-            articles_data.append((section_name, article_title, article_content, filename))
 
-    return articles_data, today
+            if manifest is not None:
+                manifest['articles'].append({'section': section_name, 'title': article_title, 'url': article_url,
+                                             'filename': filename, 'hash': digest.hex()})
+            if spool is not None:
+                yield Article(section_name, article_title, spool.write(article_content), filename, spool)
+            else:
+                yield Article(section_name, article_title, article_content, filename)
+
+def content_digest(article_title, article_content):
+    # 去掉所有空白(含全角空格)后计算摘要，用于判断重复文章；只保留20字节摘要而不是整篇正文
+    normalized = re.sub(r'\s+', '', article_title) + '\0' + re.sub(r'\s+', '', article_content)
+    return hashlib.sha1(normalized.encode('utf-8')).digest()
+
+def manifest_path(today, output_dir='.'):
+    return epub_path(today, output_dir)[:-len('.epub')] + '.manifest.json'
+
+def load_manifest(today, output_dir='.'):
+    # 没有清单或清单损坏时返回空字典
+    try:
+        with open(manifest_path(today, output_dir), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest, today, output_dir='.'):
+    # 内容与已有清单相同时不改写，保留原文件的修改时间
+    path = manifest_path(today, output_dir)
+    data = json.dumps(manifest, ensure_ascii=False, indent=1)
+    try:
+        with open(path, encoding='utf-8') as f:
+            if f.read() == data:
+                return
+    except OSError:
+        pass
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(data)
+    os.replace(path + '.tmp', path)
+
+def _chapter_body(data):
+    # 从已生成的章节XHTML中取回正文：去掉开头的<h2>标题和命名空间声明，还原为HTML片段
+    body = etree.fromstring(data).find('{http://www.w3.org/1999/xhtml}body')
+    children = list(body)
+    if children and etree.QName(children[0]).localname == 'h2':
+        children = children[1:]
+    fragment = ''.join(etree.tostring(child, encoding=str, method='html', with_tail=False) for child in children)
+    return re.sub(r' xmlns(?::\w+)?="[^"]*"', '', fragment)
+
+# 上一次生成的结果：依据清单从旧EPUB中读取已下载过的文章，用于增量更新
+class PreviousBuild:
+    def __init__(self, today, output_dir='.'):
+        with open(manifest_path(today, output_dir), encoding='utf-8') as f:
+            manifest = json.load(f)
+        # 读取旧EPUB的副本，新文件生成后可以直接替换原文件
+        fd, self._copy_path = tempfile.mkstemp(suffix='.epub', dir=output_dir)
+        os.close(fd)
+        shutil.copyfile(epub_path(today, output_dir), self._copy_path)
+        self._zip = zipfile.ZipFile(self._copy_path)
+        names = set(self._zip.namelist())
+        self._articles = {article['url']: article for article in manifest['articles']
+                          if not article.get('duplicate') and 'EPUB/' + article['filename'] in names}
+        # 记录了失败页面的清单中，各版面带有文章链接，补全时可以不再请求首页和这些版面页
+        self.failures = manifest.get('failures', [])
+        self.sections = manifest['sections'] if 'failures' in manifest else None
+        # 上次是否在出版当天结束后生成且所有文章都已确认过：是则其中的文章不会再变化，复用时无需请求
+        self.final = manifest.get('final', False)
+        # 正文的规范化方式；未记录的清单是规范化成为默认之前生成的，保留原始标记
+        self.markup = manifest.get('markup', 'raw')
+        self.reused = set()  # 本次实际复用了旧章节的文章URL
+
+    @classmethod
+    def load(cls, today, output_dir='.'):
+        if not (os.path.exists(manifest_path(today, output_dir)) and epub_is_valid(epub_path(today, output_dir))):
+            return None
+        try:
+            return cls(today, output_dir)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+
+    def __contains__(self, url):
+        return url in self._articles
+
+    def __len__(self):
+        return len(self._articles)
+
+    def read(self, url, images=None):
+        content = _chapter_body(self._zip.read('EPUB/' + self._articles[url]['filename']))
+        if images is not None:
+            # 复用的文章所引用的图片也从旧EPUB中取出
+            for name in re.findall(r'src="(images/[^"]+)"', content):
+                if 'EPUB/' + name in self._zip.namelist():
+                    images.add_existing(name, self._zip.read('EPUB/' + name))
+        return content
+
+    def __iter__(self):
+        # 按清单中的顺序遍历可复用的文章记录
+        return iter(self._articles.values())
+
+    def hash(self, url):
+        return self._articles[url]['hash']
+
+    def discard_articles(self):
+        # 不再复用任何旧章节(规范化方式已改变)，各篇文章重新获取；版面和失败页面的记录仍可使用
+        self._articles = {}
+        self.final = False
+
+    def close(self):
+        self._zip.close()
+        os.remove(self._copy_path)
+
+SEARCH_INDEX = os.path.join(os.path.expanduser('~'), '.pdec', 'search.db')
+
+_CJK_RUN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+def _bigrams(text, query=False):
+    # SQLite自带的分词器不切分连续的汉字，因此预先把汉字串切成相互重叠的二字词：
+    # “人民日报” → “人民 民日 日报 报”。末尾的单字使单字检索也能命中；检索词本身不加末尾单字
+    def split_run(match):
+        run = match.group()
+        tokens = [run[i:i + 2] for i in range(len(run) - 1)]
+        if not (query and tokens):
+            tokens.append(run[-1])
+        return ' ' + ' '.join(tokens) + ' '
+    return _CJK_RUN.sub(split_run, text)
+
+def search_expression(query):
+    # 空格分隔的每个词转为一个短语，各短语须同时出现；以单个汉字结尾的词按前缀匹配(“股”可命中“股市”)
+    phrases = []
+    for term in query.split():
+        tokens = _bigrams(term, query=True).split()
+        if not tokens:
+            continue
+        phrase = '"' + ' '.join(tokens).replace('"', '""') + '"'
+        if _CJK_RUN.fullmatch(tokens[-1]) and len(tokens[-1]) == 1:
+            phrase += '*'
+        phrases.append(phrase)
+    return ' AND '.join(phrases)
+
+def _article_text(content):
+    return html.fragment_fromstring(content, create_parent='div').text_content().strip()
+
+# 本地全文检索索引(SQLite FTS5)：每期报纸在一个事务中整体替换，新增一天只写入当天的文章。
+# 全文表不保存原文(content='')，正文压缩后存入articles表，用于删除旧索引和显示摘要。
+# 文章的rowid为 日期*10000+序号，检索时按rowid倒序取前若干条即为最新的结果，不必对全部匹配排序
+class SearchIndex:
+    _SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS issues (date TEXT PRIMARY KEY, epub TEXT);
+        CREATE TABLE IF NOT EXISTS articles (id INTEGER PRIMARY KEY, date TEXT, section TEXT, title TEXT,
+                                             filename TEXT, body BLOB);
+        CREATE INDEX IF NOT EXISTS articles_date ON articles (date);
+        CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5 (title, body, content='');
+    '''
+
+    def __init__(self, path=SEARCH_INDEX):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(self._SCHEMA)
+
+    def has_issue(self, today):
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM issues WHERE date = ?', (today,)).fetchone() is not None
+
+    def add_issue(self, today, epub_file, articles):
+        # articles为 (版面名, 标题, 正文纯文本, 文件名)；同一日期再次加入时替换原有记录
+        with self._lock, self._db:
+            self._remove(today)
+            self._db.execute('INSERT INTO issues (date, epub) VALUES (?, ?)', (today, epub_file))
+            first_id = int(re.sub(r'\D', '', today)) * 10000
+            for row_id, (section_name, article_title, text, filename) in enumerate(articles, start=first_id):
+                self._db.execute(
+                    'INSERT INTO articles (id, date, section, title, filename, body) VALUES (?, ?, ?, ?, ?, ?)',
+                    (row_id, today, section_name, article_title, filename, zlib.compress(text.encode('utf-8'))))
+                self._db.execute('INSERT INTO articles_fts (rowid, title, body) VALUES (?, ?, ?)',
+                                 (row_id, _bigrams(article_title), _bigrams(text)))
+
+    def _remove(self, today):
+        # 不保存原文的全文表只能用与写入时相同的内容删除
+        rows = self._db.execute('SELECT id, title, body FROM articles WHERE date = ?', (today,)).fetchall()
+        self._db.executemany(
+            "INSERT INTO articles_fts (articles_fts, rowid, title, body) VALUES ('delete', ?, ?, ?)",
+            [(row_id, _bigrams(article_title), _bigrams(zlib.decompress(body).decode('utf-8')))
+             for row_id, article_title, body in rows])
+        self._db.execute('DELETE FROM articles WHERE date = ?', (today,))
+        self._db.execute('DELETE FROM issues WHERE date = ?', (today,))
+
+    def add_build(self, today, output_dir='.'):
+        # 把已生成的EPUB加入索引(依据清单读取各篇正文)，返回是否成功
+        previous = PreviousBuild.load(today, output_dir)
+        if previous is None:
+            return False
+        try:
+            self.add_issue(today, epub_path(today, output_dir),
+                           [(article['section'], article['title'], _article_text(previous.read(article['url'])),
+                             article['filename']) for article in previous])
+        finally:
+            previous.close()
+        return True
+
+    def search(self, query, limit=20):
+        # 从新到旧返回 [{'date', 'section', 'title', 'epub', 'chapter', 'snippet'}]
+        expression = search_expression(query)
+        if not expression:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT a.date, a.section, a.title, i.epub, a.filename, a.body FROM '
+                '(SELECT rowid FROM articles_fts WHERE articles_fts MATCH ? ORDER BY rowid DESC LIMIT ?) m '
+                'JOIN articles a ON a.id = m.rowid LEFT JOIN issues i ON i.date = a.date ORDER BY a.id DESC',
+                (expression, limit)).fetchall()
+        terms = query.split()
+        return [{'date': today, 'section': section_name, 'title': article_title, 'epub': epub_file,
+                 'chapter': filename, 'snippet': _snippet(zlib.decompress(body).decode('utf-8'), terms)}
+                for today, section_name, article_title, epub_file, filename, body in rows]
+
+    def close(self):
+        self._db.close()
+
+def _snippet(text, terms, width=30):
+    text = re.sub(r'\s+', ' ', text).strip()
+    positions = [text.find(term) for term in terms if term in text]
+    start = max(min(positions) - width // 2, 0) if positions else 0
+    return ('…' if start else '') + text[start:start + width * 2] + ('…' if start + width * 2 < len(text) else '')
 
 def parse_date_input(user_input):
     current_year = datetime.now().year
@@ -120,14 +1333,98 @@ def parse_date_input(user_input):
     except ValueError as e:
         return None, False
 
-def create_epub(articles_data, today):
+MIN_DATE = datetime(2022, 1, 1)  # 官网电子版可下载的最早日期
+
+def _parse_single_date(text):
+    text = text.strip()
+    for fmt in ('%Y-%m-%d', '%Y-%m/%d', '%Y%m%d'):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            pass
+    date_str, _ = parse_date_input(text)
+    if date_str is None:
+        raise ValueError(f'无法识别的日期：{text}')
+    return datetime.strptime(date_str, '%Y-%m/%d')
+
+def expand_date_args(date_args):
+    # 支持单个日期、"起始..结束"日期范围以及parse_date_input的简写形式，结果去重并保持输入顺序
+    dates = []
+    for arg in date_args:
+        if '..' in arg:
+            start, end = (_parse_single_date(part) for part in arg.split('..', 1))
+            if start > end:
+                raise ValueError(f'日期范围的起始日期晚于结束日期：{arg}')
+            dates.extend(start + timedelta(days=i) for i in range((end - start).days + 1))
+        else:
+            dates.append(_parse_single_date(arg))
+
+    result = []
+    for date in dates:
+        if date < MIN_DATE:
+            raise ValueError(f'仅支持2022年1月1日及以后的报纸下载：{date:%Y-%m-%d}')
+        date_str = date.strftime('%Y-%m/%d')
+        if date_str not in result:
+            result.append(date_str)
+    return result
+
+def epub_path(today, output_dir='.'):
+    return os.path.join(output_dir, f'人民日报_{today.replace("/", "-")}.epub')
+
+BOOK_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'http://paper.people.com.cn/rmrb/')
+
+def book_identifier(title):
+    # 由书名(含日期)得到固定的标识符，同一期报纸每次生成的EPUB标识相同，阅读器和同步工具不会当作新书
+    return f'urn:uuid:{uuid.uuid5(BOOK_ID_NAMESPACE, title)}'
+
+def issue_time(today):
+    # 作为EPUB的修改时间(dcterms:modified)和zip中各文件的时间戳，内容相同则生成的文件逐字节相同
+    return datetime.strptime(today, '%Y-%m/%d')
+
+# zip中各文件使用固定的时间戳和权限，而不是写入时的当前时间
+class ReproducibleZipFile(zipfile.ZipFile):
+    def __init__(self, file, mode='r', compression=zipfile.ZIP_STORED, date_time=(1980, 1, 1, 0, 0, 0), **kwargs):
+        super().__init__(file, mode, compression, **kwargs)
+        self.date_time = tuple(date_time)[:6]
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None):
+        if not isinstance(zinfo_or_arcname, zipfile.ZipInfo):
+            zinfo_or_arcname = zipfile.ZipInfo(zinfo_or_arcname, self.date_time)
+            zinfo_or_arcname.compress_type = self.compression
+            compresslevel = self.compresslevel if compresslevel is None else compresslevel
+        zinfo_or_arcname.date_time = self.date_time
+        zinfo_or_arcname.external_attr = 0o644 << 16
+        super().writestr(zinfo_or_arcname, data, compress_type, compresslevel)
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+def replace_if_changed(temp_path, path, metrics=None):
+    # 新生成的文件与已有文件内容相同时删除临时文件、保留原文件及其修改时间，同步工具不会重复上传；返回是否替换
+    if (os.path.exists(path) and os.path.getsize(path) == os.path.getsize(temp_path)
+            and _file_digest(path) == _file_digest(temp_path)):
+        os.remove(temp_path)
+        print(f'内容未变化，保留原文件：{path}')
+        if metrics is not None:
+            metrics.count('unchanged_epubs')
+        return False
+    os.replace(temp_path, path)
+    return True
+
+def create_epub(articles_data, today, output_dir='.', images=None, metrics=None):
     book = epub.EpubBook()
     book.set_title(f'人民日报_{today.replace("/", "-")}')
+    book.set_identifier(book_identifier(f'人民日报_{today.replace("/", "-")}'))
     sections = {}
     spine = ['nav']
     toc = []
 
-    for section_name, article_title, content, filename in articles_data:
+    for article in articles_data:
+        section_name, article_title, filename = article.section, article.title, article.filename
         if section_name not in sections:
             sections[section_name] = {
                 'section': epub.EpubHtml(title=section_name, file_name=f'{section_name}.xhtml', lang='zh', content=f'<h1>{section_name}</h1>'),
@@ -136,7 +1433,15 @@ def create_epub(articles_data, today):
             book.add_item(sections[section_name]['section'])
 
         article_id = f'article_{filename[:-6]}'
-        sub_section = epub.EpubHtml(title=article_title, file_name=filename, content=f'<h2>{article_title}</h2>{content}', lang='zh')
+        if article.is_reference:
+            # 其他版面已收录的同一篇文章，只在目录中添加指向原文的链接
+            link_id = f'{article_id}_ref_{len(sections[section_name]["articles"])}'
+            sections[section_name]['articles'].append(epub.Link(filename, article_title, link_id))
+            continue
+        if article.spool is not None:
+            sub_section = _spooled_epub_html_class()(article, title=article_title, file_name=filename, lang='zh')
+        else:
+            sub_section = epub.EpubHtml(title=article_title, file_name=filename, content=f'<h2>{article_title}</h2>{article.body}', lang='zh')
         sections[section_name]['articles'].append(sub_section)
         book.add_item(sub_section)
 
@@ -144,15 +1449,304 @@ def create_epub(articles_data, today):
         spine.append(section_info['section'])
         toc.append((section_info['section'], section_info['articles']))
         for article in section_info['articles']:
-            spine.append(article)
+            if isinstance(article, epub.EpubHtml):
+                spine.append(article)
 
     book.spine = spine
     book.toc = toc
     book.add_item(epub.EpubNcx())
     book.add_item(epub.EpubNav())
     book.add_item(epub.EpubItem(uid="style_nav", file_name="style/nav.css", media_type="text/css", content='BODY {color: black;}'))
-    epub_filename = f'人民日报_{today.replace("/", "-")}.epub'
-    epub.write_epub(epub_filename, book, {})
+    if images is not None:
+        # 只写入正文中引用到的图片
+        used = {name for article in articles_data if not article.is_reference
+                for name in re.findall(r'src="(images/[^"]+)"', article.content)}
+        for name, data, media_type in sorted(item for item in images.pop_pending() if item[0] in used):
+            book.add_item(epub.EpubImage(uid=f'image_{os.path.basename(name).split(".")[0]}', file_name=name,
+                                         media_type=media_type, content=data))
+    epub_filename = epub_path(today, output_dir)
+    # 先写入临时文件再替换，中途崩溃不会留下残缺的EPUB
+    with metrics.span('write', date=today) if metrics is not None else nullcontext():
+        writer = _reproducible_epub_writer_class()(epub_filename + '.tmp', book, {'mtime': issue_time(today)})
+        writer.process()
+        writer.write()
+    replace_if_changed(epub_filename + '.tmp', epub_filename, metrics)
+    return epub_filename
+
+# ebooklib的EpubWriter.write以当前时间写入zip中的各文件，这里改用ReproducibleZipFile，时间取自mtime选项
+@functools.lru_cache(maxsize=None)
+def _reproducible_epub_writer_class():
+    class ReproducibleEpubWriter(epub.EpubWriter):
+        def write(self):
+            self.out = ReproducibleZipFile(self.file_name, 'w', zipfile.ZIP_DEFLATED,
+                                           date_time=self.options['mtime'].timetuple(),
+                                           compresslevel=self.options.get('compresslevel'))
+            self.out.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+            self._write_container()
+            self._write_opf()
+            self._write_items()
+            self.out.close()
+
+    return ReproducibleEpubWriter
+
+# 正文保存在ArticleSpool中的章节：ebooklib写入EPUB(及生成页码列表)时才从临时文件读出正文，用后即释放
+@functools.lru_cache(maxsize=None)
+def _spooled_epub_html_class():
+    class SpooledEpubHtml(epub.EpubHtml):
+        def __init__(self, article, **kwargs):
+            self.article = article
+            super().__init__(**kwargs)
+
+        @property
+        def content(self):
+            return f'<h2>{self.article.title}</h2>{self.article.content}'
+
+        @content.setter
+        def content(self, value):
+            pass  # 正文只从ArticleSpool读取
+
+    return SpooledEpubHtml
+
+NAV_CSS = 'BODY {color: black;}'
+
+_CONTAINER_XML = '''<?xml version="1.0" encoding="utf-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="EPUB/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+'''
+
+def _xhtml_document(title, content, lang='zh', stylesheet=None):
+    # 与ebooklib相同的做法：用HTML解析器容错解析正文，再按XHTML序列化
+    root = etree.fromstring(b'<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops"/>')
+    root.set('lang', lang)
+    root.set('{http://www.w3.org/XML/1998/namespace}lang', lang)
+    head = etree.SubElement(root, 'head')
+    etree.SubElement(head, 'title').text = title
+    if stylesheet:
+        etree.SubElement(head, 'link', href=stylesheet, rel='stylesheet', type='text/css')
+    body = etree.SubElement(root, 'body')
+    parsed_body = html.document_fromstring(content, parser=html.HTMLParser(encoding='utf-8')).find('body')
+    if parsed_body is not None:
+        for child in parsed_body:
+            body.append(child)
+    return etree.tostring(root.getroottree(), pretty_print=True, encoding='utf-8', xml_declaration=True, doctype='<!DOCTYPE html>')
+
+# 边生成边写入的EPUB：每个文档一到就压缩写入zip，只在内存中保留文件名和标题，
+# 最后再写入OPF、NCX和导航页。toc为 [(标题, 文件名, 子目录列表), ...]
+class StreamingEpubWriter:
+    def __init__(self, target, title, identifier=None, lang='zh', modified=datetime(1980, 1, 1)):
+        self.title = title
+        self.lang = lang
+        self.identifier = identifier or book_identifier(title)
+        self.modified = modified
+        self._zip = ReproducibleZipFile(target, 'w', zipfile.ZIP_DEFLATED, date_time=modified.timetuple())
+        self._zip.writestr(zipfile.ZipInfo('mimetype'), 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        self._zip.writestr('META-INF/container.xml', _CONTAINER_XML)
+        self._manifest = []  # (id, 文件名, 媒体类型)
+        self.add_item('style/nav.css', NAV_CSS, 'text/css', 'style_nav')
+
+    def add_item(self, file_name, data, media_type, item_id=None):
+        item_id = item_id or f'item_{len(self._manifest)}'
+        self._zip.writestr('EPUB/' + file_name, data)
+        self._manifest.append((item_id, file_name, media_type))
+        return item_id
+
+    def add_document(self, file_name, title, content, link_stylesheet=False):
+        # link_stylesheet为True时引用全书共用的style/nav.css（按文档所在目录计算相对路径）
+        stylesheet = '../' * file_name.count('/') + 'style/nav.css' if link_stylesheet else None
+        return self.add_item(file_name, _xhtml_document(title, content, self.lang, stylesheet), 'application/xhtml+xml')
+
+    def close(self, spine, toc):
+        ids = {file_name: item_id for item_id, file_name, _ in self._manifest}
+        self._zip.writestr('EPUB/nav.xhtml', self._nav_xhtml(toc))
+        self._zip.writestr('EPUB/toc.ncx', self._toc_ncx(toc))
+        manifest = [('nav', 'nav.xhtml', 'application/xhtml+xml'), ('ncx', 'toc.ncx', 'application/x-dtbncx+xml')]
+        manifest += self._manifest
+        items = ''.join(f'\n    <item href={saxutils.quoteattr(file_name)} id="{item_id}" media-type="{media_type}"'
+                        + (' properties="nav"/>' if item_id == 'nav' else '/>')
+                        for item_id, file_name, media_type in manifest)
+        itemrefs = ''.join(f'\n    <itemref idref="{item_id}"/>' for item_id in ['nav'] + [ids[file_name] for file_name in spine])
+        opf = (f'<?xml version="1.0" encoding="utf-8"?>\n'
+               f'<package xmlns="http://www.idpf.org/2007/opf" unique-identifier="id" version="3.0">\n'
+               f'  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">\n'
+               f'    <dc:identifier id="id">{saxutils.escape(self.identifier)}</dc:identifier>\n'
+               f'    <dc:title>{saxutils.escape(self.title)}</dc:title>\n'
+               f'    <dc:language>{self.lang}</dc:language>\n'
+               f'    <meta property="dcterms:modified">{self.modified:%Y-%m-%dT%H:%M:%SZ}</meta>\n'
+               f'  </metadata>\n'
+               f'  <manifest>{items}\n  </manifest>\n'
+               f'  <spine toc="ncx">{itemrefs}\n  </spine>\n'
+               f'</package>\n')
+        self._zip.writestr('EPUB/content.opf', opf)
+        self._zip.close()
+
+    def abort(self):
+        self._zip.close()
+
+    def _nav_xhtml(self, toc):
+        def render(entries):
+            return '<ol>' + ''.join(f'<li><a href={saxutils.quoteattr(file_name)}>{saxutils.escape(title)}</a>'
+                                    f'{render(children) if children else ""}</li>'
+                                    for title, file_name, children in entries) + '</ol>'
+        return (f'<?xml version="1.0" encoding="utf-8"?>\n<!DOCTYPE html>\n'
+                f'<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" '
+                f'lang="{self.lang}" xml:lang="{self.lang}">\n'
+                f'<head><title>{saxutils.escape(self.title)}</title></head>\n'
+                f'<body><nav epub:type="toc" id="id" role="doc-toc"><h2>{saxutils.escape(self.title)}</h2>{render(toc)}</nav></body>\n'
+                f'</html>\n')
+
+    def _toc_ncx(self, toc):
+        counter = [0]
+
+        def render(entries):
+            points = []
+            for title, file_name, children in entries:
+                counter[0] += 1
+                points.append(f'<navPoint id="navpoint_{counter[0]}"><navLabel><text>{saxutils.escape(title)}</text></navLabel>'
+                              f'<content src={saxutils.quoteattr(file_name)}/>{render(children)}</navPoint>')
+            return ''.join(points)
+
+        nav_map = render(toc)
+        return (f'<?xml version="1.0" encoding="utf-8"?>\n'
+                f'<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">\n'
+                f'<head><meta content={saxutils.quoteattr(self.identifier)} name="dtb:uid"/></head>\n'
+                f'<docTitle><text>{saxutils.escape(self.title)}</text></docTitle>\n'
+                f'<navMap>{nav_map}</navMap>\n</ncx>\n')
+
+def _write_issue(writer, articles, prefix='', link_stylesheet=False, images=None, shared_images=False):
+    # 把一期的文章写入writer，同名版面合并为一个目录；返回该期的 (spine, toc)。
+    # 每写完一篇文章就把它用到的图片按引用顺序一并写入，图片数据不会在内存中堆积，文件顺序也与下载先后无关。
+    # 图片默认与文章一样放在prefix下；shared_images为True时放在书的根目录下，供合集中各天共用
+    sections = {}  # 版面名 → (版面文件名, [(标题, 文件名, 是否为交叉引用)])
+    for article in articles:
+        section_name, article_title, filename = article.section, article.title, article.filename
+        if section_name not in sections:
+            section_file = f'{prefix}{section_name}.xhtml'
+            writer.add_document(section_file, section_name, f'<h1>{section_name}</h1>', link_stylesheet)
+            sections[section_name] = (section_file, [])
+        if not article.is_reference:
+            content = article.content
+            if shared_images and prefix:
+                content = content.replace('src="images/', 'src="' + '../' * prefix.count('/') + 'images/')
+            writer.add_document(prefix + filename, article_title, f'<h2>{article_title}</h2>{content}',
+                                link_stylesheet)
+            if images is not None:
+                for name, data, media_type in images.pop_pending(content):
+                    writer.add_item(name if shared_images else prefix + name, data, media_type)
+        sections[section_name][1].append((article_title, prefix + filename, article.is_reference))
+    if images is not None:
+        images.discard_pending()
+
+    spine = []
+    toc = []
+    for section_name, (section_file, articles) in sections.items():
+        spine.append(section_file)
+        spine.extend(filename for _, filename, is_reference in articles if not is_reference)
+        toc.append((section_name, section_file, [(article_title, filename, []) for article_title, filename, _ in articles]))
+    return spine, toc
+
+def create_epub_streaming(articles, today, output_dir='.', images=None, metrics=None):
+    # 与create_epub生成相同结构的电子书，但articles可以是iter_articles这样的迭代器，文章一到就写入
+    epub_filename = epub_path(today, output_dir)
+    writer = StreamingEpubWriter(epub_filename + '.tmp', f'人民日报_{today.replace("/", "-")}',
+                                 modified=issue_time(today))
+    try:
+        spine, toc = _write_issue(writer, articles, images=images)
+    except BaseException:
+        writer.abort()
+        os.remove(epub_filename + '.tmp')
+        raise
+    with metrics.span('write', date=today) if metrics is not None else nullcontext():
+        writer.close(spine, toc)
+
+    if not spine:
+        os.remove(epub_filename + '.tmp')
+        return None
+    replace_if_changed(epub_filename + '.tmp', epub_filename, metrics)
+    return epub_filename
+
+def compilation_path(dates, output_dir='.'):
+    first, last = dates[0].replace('/', '-'), dates[-1].replace('/', '-')
+    return os.path.join(output_dir, f'人民日报_{first}_{last}.epub' if first != last else f'人民日报_{first}.epub')
+
+def create_compilation_epub(dates, client, output_dir='.', max_workers=MAX_WORKERS, image_options=None,
+                            search_index=None, normalizer=None):
+    # 把多天的报纸合并为一本电子书：目录为 日期 → 版面 → 文章，全书共用一份样式表，
+    # 开头附标题索引。逐天下载并写入，内存中只保留目录信息。
+    # search_index为SearchIndex时各天的文章以合集中的章节写入全文索引(替换该日期原有的记录)
+    epub_filename = compilation_path(dates, output_dir)
+    writer = StreamingEpubWriter(epub_filename + '.tmp', os.path.basename(epub_filename)[:-len('.epub')],
+                                 modified=issue_time(dates[-1]))
+    spine = []
+    toc = []
+    title_index = []  # (日期, [(版面名, 标题, 文件名)])
+    indexed = {}  # 日期 → 全文索引记录
+    # 各天共用一个ImageStore，图片放在书的根目录下并按内容哈希去重，多天转载的同一张图只保存一份
+    images = ImageStore(client, max_workers, **image_options) if image_options is not None else None
+    try:
+        for target_date in dates:
+            date_obj = datetime.strptime(target_date, '%Y-%m/%d')
+            print(f'正在下载《人民日报》{format_date_chinese(date_obj)}……')
+            prefix = f'{date_obj:%Y%m%d}/'
+            day_titles = []
+
+            def recorded(articles):
+                for article in articles:
+                    day_titles.append((article.section, article.title, prefix + article.filename))
+                    yield article
+
+            articles = recorded(iter_articles(target_date, client, max_workers, images=images, normalizer=normalizer))
+            if search_index is not None:
+                articles = _indexed(articles, indexed.setdefault(target_date, []), prefix)
+            day_spine, day_toc = _write_issue(writer, articles, prefix, link_stylesheet=True, images=images,
+                                              shared_images=True)
+            if not day_spine:
+                print(f'{target_date} 没有可下载的文章，已跳过')
+                continue
+            day_file = prefix + 'index.xhtml'
+            writer.add_document(day_file, format_date_chinese(date_obj),
+                                f'<h1>{format_date_chinese(date_obj)}</h1>', link_stylesheet=True)
+            spine.append(day_file)
+            spine.extend(day_spine)
+            toc.append((format_date_chinese(date_obj), day_file, day_toc))
+            title_index.append((format_date_chinese(date_obj), day_titles))
+    except BaseException:
+        writer.abort()
+        os.remove(epub_filename + '.tmp')
+        raise
+    finally:
+        if images is not None:
+            images.close()
+
+    if not spine:
+        writer.abort()
+        os.remove(epub_filename + '.tmp')
+        return None
+
+    index_content = '<h1>标题索引</h1>' + ''.join(
+        f'<h2>{saxutils.escape(day)}</h2><ul>' + ''.join(
+            f'<li><a href={saxutils.quoteattr(filename)}>{saxutils.escape(article_title)}</a>（{saxutils.escape(section_name)}）</li>'
+            for section_name, article_title, filename in day_titles) + '</ul>'
+        for day, day_titles in title_index)
+    writer.add_document('index.xhtml', '标题索引', index_content, link_stylesheet=True)
+    writer.close(['index.xhtml'] + spine, [('标题索引', 'index.xhtml', [])] + toc)
+    replace_if_changed(epub_filename + '.tmp', epub_filename, client.metrics)
+    if search_index is not None:
+        for target_date, articles in indexed.items():
+            if articles:
+                search_index.add_issue(target_date, epub_filename, articles)
+    return epub_filename
+
+def group_dates(dates, period):
+    # 按 all/month/week 把日期分组，每组合并为一本电子书
+    groups = {}
+    for target_date in dates:
+        date_obj = datetime.strptime(target_date, '%Y-%m/%d')
+        key = {'all': None, 'month': (date_obj.year, date_obj.month), 'week': date_obj.isocalendar()[:2]}[period]
+        groups.setdefault(key, []).append(target_date)
+    return list(groups.values())
 
 def format_date_chinese(date):
     weekdays = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
@@ -162,8 +1756,639 @@ def format_date_chinese(date):
     weekday = weekdays[date.weekday()]
     return f"{year}年{month}月{day}日{weekday}"
 
+STATE_FILE = 'pdec_state.json'  # 批量下载进度文件，保存在输出目录中
+BATCH_JOBS = 2                   # 批量下载时同时处理的报纸期数
+MIN_COMPLETENESS = 1.0           # 成功获取的页面比例低于此值时，电子书标记为不完整
+
+def epub_is_valid(path):
+    try:
+        with zipfile.ZipFile(path) as zf:
+            return 'mimetype' in zf.namelist() and zf.testzip() is None
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+# 记录每个日期的处理状态(fetching/done/failed)，每次更新都原子地写回磁盘，便于中断后继续
+class BatchState:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, date):
+        with self._lock:
+            return dict(self.entries.get(date, {}))
+
+    def update(self, date, **fields):
+        with self._lock:
+            entry = self.entries.setdefault(date, {})
+            entry.update(fields, updated=datetime.now().isoformat(timespec='seconds'))
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1)
+            os.replace(self.path + '.tmp', self.path)
+
+AVAILABILITY_FILE = os.path.join(os.path.expanduser('~'), '.pdec', 'availability.json')  # 各日期是否已发行的探测结果
+RECHECK_DAYS = 3  # 最近几天的"未发行"结果不保存(报纸可能稍后才上传)，下次重新探测
+MISSING_TTL_DAYS = 30  # 较早日期的"未发行"结果保存多少天后重新探测
+
+def _probe_issue(client, today):
+    # 用HEAD请求探测某期首页是否存在：存在返回True，404/410返回False，网络出错等无法判断时返回None。
+    # 首页已在网页缓存中时不发请求；服务器不支持HEAD时改用GET
+    url = get_layout(today).index_url(today)
+    if client.cache is not None and url in client.cache:
+        return True
+    try:
+        try:
+            client.head(url)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code not in (405, 501):
+                raise
+            client.get(url)
+        return True
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code in (404, 410):
+            return False
+        return None
+    except requests.RequestException:
+        return None
+
+# 各日期报纸是否已发行的索引，保存为JSON文件：已发行的日期为true，未发行的日期为探测时刻的时间戳，过期后重新探测
+# (旧版本保存的false视为已过期)。
+# 日历用它标出未发行的日期，批量下载时据此跳过，不必逐期请求首页后才发现不存在
+class AvailabilityIndex:
+    def __init__(self, path=AVAILABILITY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, today, recheck_missing=False):
+        # 已发行返回True，未发行返回False，尚未探测、无法判断或"未发行"结果已过期返回None；
+        # recheck_missing为True时不采用"未发行"的结果
+        with self._lock:
+            entry = self.entries.get(today)
+        if entry is True:
+            return True
+        if isinstance(entry, bool) or not isinstance(entry, (int, float)) or recheck_missing:
+            return None
+        return False if time.time() - entry < MISSING_TTL_DAYS * 86400 else None
+
+    def probe(self, dates, client, max_workers=MAX_WORKERS, recheck_missing=False):
+        # 并发探测dates中尚无结果的日期，返回 {日期: True/False/None}；recheck_missing为True时重新探测未发行的日期
+        result = {today: self.get(today, recheck_missing) for today in dates}
+        unknown = [today for today, available in result.items() if available is None]
+        if not unknown:
+            return result
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for today, available in zip(unknown, executor.map(lambda today: _probe_issue(client, today), unknown)):
+                result[today] = available
+        recent = (datetime.now() - timedelta(days=RECHECK_DAYS)).strftime('%Y-%m/%d')
+        with self._lock:
+            for today in unknown:
+                if result[today]:
+                    self.entries[today] = True
+                elif result[today] is False:
+                    # 最近几天的"未发行"结果不保存，内存中也不保留，下次(包括图形界面再次翻到这个月时)重新探测
+                    if today < recent:
+                        self.entries[today] = round(time.time())
+                    else:
+                        self.entries.pop(today, None)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, sort_keys=True, indent=0)
+            os.replace(self.path + '.tmp', self.path)
+        return result
+
+def month_dates(year, month):
+    # 某月中可以下载的日期(不早于MIN_DATE，不晚于今天)
+    first = datetime(year, month, 1)
+    days = (datetime(year + month // 12, month % 12 + 1, 1) - first).days
+    now = datetime.now()
+    return [day.strftime('%Y-%m/%d') for day in (first + timedelta(days=n) for n in range(days))
+            if MIN_DATE <= day <= now]
+
+def prefetch_issue(today, client, max_workers=MAX_WORKERS):
+    # 把某期的首页和各版面页预先下载到网页缓存，之后生成这一期时只需请求文章页。出错的页面忽略，返回成功的页数
+    layout = get_layout(today)
+    base_url = layout.base_url(today)
+    try:
+        response = client.get(layout.index_url(today))
+    except requests.RequestException:
+        return 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(client.get, section_url)
+                   for _, section_url in layout.parse_index(response.content, base_url)]
+        return 1 + sum(1 for future in futures if future.exception() is None)
+
+def issue_completeness(manifest):
+    # 成功获取的版面页和文章页(不含重复文章)占全部页面的比例
+    failures = manifest.get('failures', [])
+    total = (len(manifest.get('sections', [])) + sum(1 for failure in failures if failure['kind'] == 'article')
+             + sum(1 for article in manifest.get('articles', []) if not article.get('duplicate')))
+    return 1.0 - len(failures) / total if total else 0.0
+
+def build_issue(target_date, client, output_dir='.', max_workers=MAX_WORKERS, stream=False, incremental=False,
+                image_options=None, search_index=None, spool=False, retry_failed=False,
+                min_completeness=MIN_COMPLETENESS, normalizer=None):
+    # 生成一期报纸并在EPUB旁保存清单(版面、文章URL与内容哈希，以及获取失败的页面)；incremental为True时复用上次已下载的文章：
+    # 上次在出版当天结束后生成的直接复用，否则经条件请求确认未变化后复用，新出现和有变化的文章重新下载；retry_failed为True时连首页和已获取的版面页也不再请求，只重新获取上次失败的页面。
+    # image_options不为None时下载配图，内容为ImageStore的压缩选项。
+    # search_index为SearchIndex时把本期文章写入全文索引；spool为True时(非流式)正文暂存在临时文件中；
+    # normalizer为Normalizer时对正文做规范化。返回 (EPUB路径, 文章数, 报告)，无文章时路径为None；报告为 {'completeness': 完整度, 'partial': 完整度是否低于
+    # min_completeness, 'failures': 失败页面列表}
+    started = datetime.now()
+    markup = normalizer.markup if normalizer is not None else 'raw'
+    previous = PreviousBuild.load(target_date, output_dir) if incremental or retry_failed else None
+    if previous is not None and previous.markup != markup:
+        # 旧章节与本次生成的字节不同，重新获取全部文章(通常命中网页缓存)，不计为"内容有变化"
+        print(f'{target_date}：正文规范化方式已改变，重新获取全部文章')
+        previous.discard_articles()
+    sections = previous.sections if retry_failed and previous is not None else None
+    # 上次的结果不是最终版本时，增量更新逐篇确认已有文章；补全失败页面时只请求失败的页面
+    revalidate = incremental and not retry_failed and previous is not None and not previous.final
+    images = ImageStore(client, max_workers, **image_options) if image_options is not None else None
+    article_spool = ArticleSpool() if spool and not stream else None
+    manifest = {}
+    fetched = []
+    reused = 0
+    indexed = []
+    try:
+        articles = iter_articles(target_date, client, max_workers, previous, manifest, images, article_spool,
+                                 sections, normalizer=normalizer, revalidate=revalidate)
+        if search_index is not None:
+            articles = _indexed(articles, indexed)
+        if stream:
+            count = [0]
+
+            def counted(articles):
+                for article in articles:
+                    count[0] += 1
+                    yield article
+
+            # 流式写入时下载与生成交错进行，整体记为build阶段
+            with client.metrics.span('build', date=target_date):
+                path = create_epub_streaming(counted(articles), target_date, output_dir, images, client.metrics)
+            article_count = count[0]
+        else:
+            with client.metrics.span('fetch', date=target_date):
+                articles_data = list(articles)
+            with client.metrics.span('build', date=target_date):
+                path = (create_epub(articles_data, target_date, output_dir, images, client.metrics)
+                        if articles_data else None)
+            article_count = len(articles_data)
+        if previous is not None:
+            fetched = [article['url'] for article in manifest.get('articles', []) if not article.get('duplicate')]
+            reused = sum(1 for url in fetched if url in previous.reused)
+    finally:
+        if previous is not None:
+            previous.close()
+        if images is not None:
+            images.close()
+        if article_spool is not None:
+            article_spool.close()
+
+    completeness = issue_completeness(manifest)
+    report = {'completeness': completeness, 'partial': completeness < min_completeness,
+              'failures': manifest.get('failures', [])}
+    if path:
+        final = started >= issue_day_end(target_date) and (previous is None or previous.final or revalidate)
+        manifest.update(completeness=round(completeness, 4), partial=report['partial'], final=final,
+                        markup=markup)
+        save_manifest(manifest, target_date, output_dir)
+        if search_index is not None:
+            search_index.add_issue(target_date, path, indexed)
+        if previous is not None:
+            print(f'{target_date}：复用 {reused} 篇，新下载 {len(fetched) - reused} 篇')
+        if report['failures']:
+            print(f'{target_date}：{len(report["failures"])} 个页面获取失败，完整度 {completeness:.1%}'
+                  f'{"，已标记为不完整" if report["partial"] else ""}')
+    return path, article_count, report
+
+def _indexed(articles, indexed, prefix=''):
+    # 原样产出文章，同时把正文的纯文本记入indexed，供生成完成后写入全文索引
+    for article in articles:
+        if not article.is_reference:
+            indexed.append((article.section, article.title, _article_text(article.content), prefix + article.filename))
+        yield article
+
+def _build_issue(target_date, client, output_dir, state, article_workers, stream=False, incremental=False,
+                 image_options=None, search_index=None, spool=False, retry_failed=False,
+                 min_completeness=MIN_COMPLETENESS, normalizer=None):
+    state.update(target_date, status='fetching')
+    print(f'正在下载《人民日报》{format_date_chinese(datetime.strptime(target_date, "%Y-%m/%d"))}……')
+    path, article_count, report = build_issue(target_date, client, output_dir, article_workers, stream, incremental,
+                                              image_options, search_index, spool, retry_failed, min_completeness,
+                                              normalizer)
+    if not path:
+        state.update(target_date, status='failed')
+        return None
+    state.update(target_date, status='partial' if report['partial'] else 'done', articles=article_count,
+                 epub=os.path.basename(path), failures=len(report['failures']))
+    return path
+
+def run_batch(dates, client, output_dir='.', jobs=BATCH_JOBS, article_workers=MAX_WORKERS,
+              state_path=None, force=False, stream=False, incremental=False, image_options=None, search_index=None,
+              spool=False, availability=None, retry_failed=False, min_completeness=MIN_COMPLETENESS,
+              normalizer=None):
+    # 同时处理jobs期报纸，每期内部再并发下载文章；所有请求共用client的连接池和每主机并发上限。
+    # availability为AvailabilityIndex时先并发探测待下载的日期，跳过未发行的日期，这些日期不出现在返回结果中。
+    # retry_failed为True时，已有EPUB的日期中只处理上次有页面获取失败的，并且只重新获取失败的页面
+    state = BatchState(state_path or os.path.join(output_dir, STATE_FILE))
+    results = {}
+    pending = []
+    for target_date in dates:
+        path = epub_path(target_date, output_dir)
+        if (retry_failed and not force and os.path.exists(path)
+                and load_manifest(target_date, output_dir).get('failures')):
+            print(f'补全上次获取失败的页面：{target_date}')
+        elif not force and not incremental and os.path.exists(path):
+            if epub_is_valid(path):
+                state.update(target_date, status='done', epub=os.path.basename(path))
+                results[target_date] = path
+                print(f'已存在，跳过：{path}')
+                # 建立索引之前生成的EPUB，依据清单补入索引
+                if search_index is not None and not search_index.has_issue(target_date):
+                    search_index.add_build(target_date, output_dir)
+                continue
+            print(f'文件损坏，重新生成：{path}')
+        elif state.get(target_date).get('status') == 'fetching':
+            # 上次中断时已下载的页面保存在磁盘缓存中，继续时不会重复请求
+            print(f'继续上次未完成的下载：{target_date}')
+        pending.append(target_date)
+
+    if availability is not None and pending:
+        # --force 时不采用缓存的"未发行"结果
+        found = availability.probe(pending, client, article_workers, recheck_missing=force)
+        for target_date in pending:
+            if found[target_date] is False:
+                print(f'{target_date} 未发行，跳过')
+                state.update(target_date, status='unavailable')
+        pending = [target_date for target_date in pending if found[target_date] is not False]
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(_build_issue, target_date, client, output_dir, state, article_workers, stream,
+                                   incremental, image_options, search_index, spool, retry_failed,
+                                   min_completeness, normalizer): target_date
+                   for target_date in pending}
+        for future in as_completed(futures):
+            target_date = futures[future]
+            try:
+                results[target_date] = future.result()
+            except Exception as e:
+                print(f'{target_date} 生成失败: {e}')
+                state.update(target_date, status='failed')
+                results[target_date] = None
+                continue
+            if results[target_date]:
+                print(f'已生成 {results[target_date]}')
+
+    return {target_date: results[target_date] for target_date in dates if target_date in results}
+
 help_url = "https://flowus.cn/share/c36bef62-e964-457c-8850-369dcbfbd222"  #实际页面URL
 
+SERVE_PORT = 8080                       # 服务模式的默认端口
+SERVE_CACHE_BYTES = 64 * 1024 * 1024    # 服务模式下在内存中缓存的电子书总大小
+SERVE_TTL = 600                         # 当天报纸的电子书缓存有效期(秒)；往期报纸不再变化，缓存到被淘汰为止
+SERVE_RECENT_DAYS = 14                  # 首页列出的最近天数
+
+def parse_section_spec(spec):
+    # "3"、"1-4"、"1-4,7" → 版次集合
+    numbers = set()
+    for part in spec.split(','):
+        start, _, end = part.partition('-')
+        try:
+            start, end = int(start), int(end or start)
+        except ValueError:
+            raise ValueError(f'无法识别的版次：{spec}') from None
+        if not 1 <= start <= end <= 999:
+            raise ValueError(f'无法识别的版次：{spec}')
+        numbers.update(range(start, end + 1))
+    return numbers
+
+def format_section_spec(numbers):
+    # parse_section_spec的逆过程，连续的版次合并为区间：{1, 2, 3, 4, 7} → "1-4,7"
+    ranges = []
+    for number in sorted(numbers):
+        if ranges and ranges[-1][1] == number - 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ','.join(str(start) if start == end else f'{start}-{end}' for start, end in ranges)
+
+def build_sections_epub(today, client, section_numbers=None, max_workers=MAX_WORKERS, image_options=None,
+                        normalizer=None):
+    # 在内存中生成只含指定版面的电子书，只请求这些版面的版面页和文章页；section_numbers为None时生成整期。
+    # 返回EPUB数据，没有文章时返回None
+    title = f'人民日报_{today.replace("/", "-")}'
+    if section_numbers is not None:
+        title += f'_第{format_section_spec(section_numbers)}版'
+    buffer = io.BytesIO()
+    writer = StreamingEpubWriter(buffer, title, modified=issue_time(today))
+    images = ImageStore(client, max_workers, **image_options) if image_options is not None else None
+    try:
+        articles = iter_articles(today, client, max_workers, images=images, section_numbers=section_numbers,
+                                 normalizer=normalizer)
+        spine, toc = _write_issue(writer, articles, images=images)
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        if images is not None:
+            images.close()
+    if not spine:
+        writer.abort()
+        return None
+    writer.close(spine, toc)
+    return buffer.getvalue()
+
+# 已生成电子书的内存缓存，按总字节数做LRU淘汰(dict按插入顺序排列，命中时移到末尾)。
+# 同一本书同时被多次请求时只生成一次，其余请求等待结果
+class AssembledCache:
+    def __init__(self, max_bytes=SERVE_CACHE_BYTES, ttl=SERVE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}   # 键 → (数据, 生成时间, 是否会过期)
+        self._building = {}  # 键 → 生成中的Future
+        self._size = 0
+        self.stats = {'hits': 0, 'builds': 0, 'evictions': 0}
+
+    def get(self, key, build, expires=False):
+        # 返回缓存中的数据，没有或已过期时调用build()生成；expires为True时缓存ttl秒后失效
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                if not (entry[2] and time.monotonic() - entry[1] > self.ttl):
+                    self._entries[key] = entry
+                    self.stats['hits'] += 1
+                    return entry[0]
+                self._size -= len(entry[0])
+            future = self._building.get(key)
+            building = future is None
+            if building:
+                future = self._building[key] = Future()
+        if not building:
+            return future.result()
+
+        try:
+            data = build()
+        except BaseException as e:
+            with self._lock:
+                del self._building[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._building[key]
+            self.stats['builds'] += 1
+            if data is not None:
+                self._entries[key] = (data, time.monotonic(), expires)
+                self._size += len(data)
+                while self._size > self.max_bytes and len(self._entries) > 1:
+                    oldest = next(iter(self._entries))
+                    self._size -= len(self._entries.pop(oldest)[0])
+                    self.stats['evictions'] += 1
+        future.set_result(data)
+        return data
+
+_SERVE_EPUB = re.compile(r'^/(\d{4}-\d{2}-\d{2})(?:/sections/([\d,-]+))?\.epub$')
+_SERVE_ISSUE = re.compile(r'^/(\d{4}-\d{2}-\d{2})/?$')
+
+def _serve_page(title, body):
+    return (f'<!DOCTYPE html>\n<html lang="zh"><head><meta charset="utf-8"><title>{saxutils.escape(title)}</title>'
+            f'</head><body><h1>{saxutils.escape(title)}</h1>{body}</body></html>\n').encode('utf-8')
+
+def serve_request(path, client, cache, max_workers=MAX_WORKERS, image_options=None, normalizer=None):
+    # 服务模式的路由，返回 (状态码, Content-Type, 正文(bytes或str), 附加响应头)：
+    #   /                                最近几天的报纸列表
+    #   /2024-12-01/                     该期的版面列表
+    #   /2024-12-01.epub                 整期电子书
+    #   /2024-12-01/sections/1-4.epub    只含第1至4版的电子书，版次也可写作 3 或 1-4,7
+    path = unquote(path.split('?', 1)[0])
+    if path == '/':
+        today = datetime.now()
+        items = ''.join(f'<li><a href="/{day:%Y-%m-%d}/">{format_date_chinese(day)}</a></li>'
+                        for day in (today - timedelta(days=n) for n in range(SERVE_RECENT_DAYS)) if day >= MIN_DATE)
+        return 200, 'text/html; charset=utf-8', _serve_page('人民日报', f'<ul>{items}</ul>'), {}
+
+    match = _SERVE_EPUB.match(path) or _SERVE_ISSUE.match(path)
+    try:
+        date_obj = datetime.strptime(match.group(1), '%Y-%m-%d') if match else None
+        section_numbers = None
+        if match and match.re is _SERVE_EPUB and match.group(2):
+            section_numbers = parse_section_spec(match.group(2))
+    except ValueError:
+        match = None
+    if not match or not MIN_DATE <= date_obj <= datetime.now():
+        return 404, 'text/plain; charset=utf-8', '未找到', {}
+    today = date_obj.strftime('%Y-%m/%d')
+    layout = get_layout(today)
+
+    if match.re is _SERVE_ISSUE:
+        try:
+            response = client.get(layout.index_url(today))
+        except requests.HTTPError:
+            return 404, 'text/plain; charset=utf-8', '该日期的报纸未发行', {}
+        sections = layout.parse_index(response.content, layout.base_url(today))
+        items = ''.join(f'<li><a href="/{match.group(1)}/sections/{n}.epub">{saxutils.escape(name)}</a></li>'
+                        for n, (name, _) in enumerate(sections, start=1))
+        links = [f'<a href="/{match.group(1)}.epub">整期</a>']
+        if len(sections) >= 4:
+            links.append(f'<a href="/{match.group(1)}/sections/1-4.epub">第1-4版</a>')
+        body = f'<p>{" · ".join(links)}</p><ol>{items}</ol>'
+        return 200, 'text/html; charset=utf-8', _serve_page(format_date_chinese(date_obj), body), {}
+
+    key = (today, format_section_spec(section_numbers) if section_numbers else None)
+    # 往期页面不会再变化，生成的电子书一直有效；当天的报纸可能更新，缓存会过期
+    data = cache.get(key, lambda: build_sections_epub(today, client, section_numbers, max_workers, image_options,
+                                                      normalizer),
+                     expires=date_obj >= datetime.now().replace(hour=0, minute=0, second=0, microsecond=0))
+    if data is None:
+        return 404, 'text/plain; charset=utf-8', '该日期的报纸未发行或所选版面没有文章', {}
+    name = f'人民日报_{match.group(1)}' + (f'_第{key[1]}版' if key[1] else '') + '.epub'
+    headers = {'ETag': f'"{hashlib.sha256(data).hexdigest()[:32]}"',
+               'Content-Disposition': f"attachment; filename=\"rmrb_{match.group(1)}.epub\"; "
+                                      f"filename*=UTF-8''{quote(name)}"}
+    return 200, 'application/epub+zip', data, headers
+
+def make_server(client, host='127.0.0.1', port=SERVE_PORT, max_workers=MAX_WORKERS, image_options=None, cache=None,
+                normalizer=None):
+    # 局域网内的阅读器可以直接按日期和版面下载电子书；页面经client的磁盘缓存按需获取
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    cache = cache if cache is not None else AssembledCache()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            self.do_GET(send_body=False)
+
+        def do_GET(self, send_body=True):
+            try:
+                status, content_type, body, headers = serve_request(self.path, client, cache, max_workers,
+                                                                    image_options, normalizer)
+            except requests.RequestException as e:
+                status, content_type, body, headers = 502, 'text/plain; charset=utf-8', f'网络请求出错: {e}', {}
+            except Exception as e:
+                status, content_type, body, headers = 500, 'text/plain; charset=utf-8', f'生成失败: {e}', {}
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+            if status == 200 and headers.get('ETag') and self.headers.get('If-None-Match') == headers['ETag']:
+                status, body = 304, b''
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.cache = cache
+    return server
+
+def run_server(args):
+    cache = None if args.no_cache else ResponseCache()
+    client = HttpClient(max_workers=args.workers, cache=cache, revalidate=True,
+                        rate_limiter=RateLimiter(args.rate, host_rates=args.host_rate))
+    image_options = image_options_from_args(args)  # 压缩图片的进程池在各次请求间共用
+    normalizer = None if args.no_normalize else Normalizer(args.simple_markup)
+    server = make_server(client, args.bind, args.serve, args.workers, image_options,
+                         AssembledCache(args.serve_cache * 1024 * 1024), normalizer)
+    host, port = server.server_address[:2]
+    print(f'服务已启动：http://{host}:{port}/ ，例如 http://{host}:{port}/{datetime.now():%Y-%m-%d}/sections/1-4.epub')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        client.close()
+        close_image_options(image_options)
+        if normalizer is not None:
+            normalizer.close()
+        print(client.summary())
+    return 0
+
+GUI_JOBS = 7  # 图形界面中同时生成的报纸期数，选择一周时七天同时下载
+PROBE_WORKERS = 4  # 图形界面探测日期是否发行时的并发请求数
+PROBE_IDLE_MS = 3000  # 启动后界面空闲这么久才联网探测当月日期，之前只显示磁盘中已有的结果
+
+# 图形界面的下载任务管理：所选日期排队后并发生成，所有任务共用一个HttpClient，
+# 总连接数受连接池大小和每主机并发上限约束。进度和结果以 (类型, 日期, 数据) 放入events队列，
+# 由Tk主线程用after()定时取出；工作线程中不调用任何Tk接口
+class DownloadManager:
+    def __init__(self, output_dir='.', jobs=GUI_JOBS, max_workers=MAX_WORKERS):
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.events = queue.Queue()
+        self.metrics = Metrics()
+        self.metrics.add_hook(self._on_metrics_event)
+        self.client = HttpClient(max_workers=max_workers, cache=ResponseCache(), revalidate=True, metrics=self.metrics)
+        self.normalizer = Normalizer()
+        self._executor = ThreadPoolExecutor(max_workers=jobs)
+        self._lock = threading.Lock()
+        self._jobs = {}  # 日期 → 取消用的threading.Event，只包含排队中和进行中的任务
+
+    def submit(self, target_date, retry_failed=False):
+        # 已在队列中的日期不会重复加入，返回是否加入；retry_failed为True时只补全上次获取失败的页面
+        with self._lock:
+            if target_date in self._jobs:
+                return False
+            cancel = self._jobs[target_date] = threading.Event()
+        self.events.put(('queued', target_date, None))
+        self._executor.submit(self._run, target_date, cancel, retry_failed)
+        return True
+
+    def cancel(self, target_date=None):
+        # 取消指定日期的任务，target_date为None时取消全部
+        with self._lock:
+            for job_date, cancel in self._jobs.items():
+                if target_date is None or job_date == target_date:
+                    cancel.set()
+
+    def _run(self, target_date, cancel, retry_failed=False):
+        # 结束事件在任务移出_jobs之后才发出，收到事件后立即重新加入同一日期不会被拒绝
+        try:
+            if cancel.is_set():
+                raise Cancelled()
+            self.events.put(('started', target_date, None))
+            path, _, report = build_issue(target_date, self.client.cancellable(cancel), self.output_dir,
+                                          self.max_workers, retry_failed=retry_failed, normalizer=self.normalizer)
+        except Cancelled:
+            event = ('cancelled', target_date, None)
+        except Exception as e:
+            event = ('failed', target_date, str(e))
+        else:
+            if path and report['partial']:
+                event = ('partial', target_date, report)
+            elif path:
+                event = ('done', target_date, path)
+            else:
+                event = ('failed', target_date, '页面未找到，请确认目标日期的《人民日报》（电子版）是否已发行。')
+        finally:
+            with self._lock:
+                del self._jobs[target_date]
+        self.events.put(event)
+
+    def _on_metrics_event(self, event):
+        if event['event'] == 'progress':
+            self.events.put(('progress', event['date'], (event['done'], event['total'])))
+
+    def close(self):
+        # 取消所有任务；已发出的请求结束后工作线程随即退出
+        self.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.normalizer.close()
+        print(self.client.summary())
+
+# 日历翻到某月时在后台探测各日期是否已发行。使用单独的小连接池，不会为此提前建立DownloadManager；
+# 磁盘中已有全部结果且不预取时不联网，也不导入requests。结果以 ('availability', None, {日期: True/False/None})
+# 放入events队列
+class AvailabilityProber:
+    def __init__(self, max_workers=PROBE_WORKERS):
+        self.max_workers = max_workers
+        self.events = queue.Queue()
+        self.index = AvailabilityIndex()
+        self._client = None
+        self._executor = ThreadPoolExecutor(max_workers=1)  # 逐月探测，不占用下载线程
+        self._closing = threading.Event()
+
+    def cached(self, year, month):
+        # 只读磁盘中的结果，未探测过的日期为None
+        return {target_date: self.index.get(target_date) for target_date in month_dates(year, month)}
+
+    def probe_month(self, year, month, prefetch=False):
+        # prefetch为True时随后把已发行各期的首页和版面页下载到网页缓存，供之后的下载使用
+        self._executor.submit(self._probe_month, year, month, prefetch)
+
+    def _probe_month(self, year, month, prefetch):
+        found = self.cached(year, month)
+        if all(available is not None for available in found.values()) and not prefetch:
+            self.events.put(('availability', None, found))
+            return
+        if self._client is None:
+            self._client = HttpClient(max_workers=self.max_workers, cache=ResponseCache(), revalidate=True)
+        client = self._client.cancellable(self._closing)
+        try:
+            found = self.index.probe(list(found), client, self.max_workers)
+            self.events.put(('availability', None, found))
+            if prefetch:
+                for target_date, available in found.items():
+                    if available:
+                        prefetch_issue(target_date, client, self.max_workers)
+        except Cancelled:
+            pass
+
+    def close(self):
+        self._closing.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
 class DatePickerApp:
     def __init__(self, master):
         self.master = master
@@ -184,35 +2409,179 @@ class DatePickerApp:
                           firstweekday='sunday',         # 新增周日作为每周首日
                           showweeknumbers=False)         # 隐藏周编号
         self.cal.pack(pady=10)
+        # 未发行的日期显示为灰色；翻到新的月份时在后台探测该月各日期
+        self.cal.tag_config('missing', background='gray80', foreground='gray50')
+        self.missing = {}  # 标为未发行的日期 -> 日历事件id
+        self.cal.bind('<<CalendarMonthChanged>>', lambda event: self.probe_displayed_month())
+        self.prefetch = BooleanVar(master, value=False)
+        ttk.Checkbutton(self.frame, text="预取本月版面", variable=self.prefetch,
+                        command=self.probe_displayed_month).pack()
         
         # 操作按钮
         self.btn_frame = Frame(self.frame)
         self.btn_frame.pack(pady=10)
         
         Button(self.btn_frame, text="确定所选日期", command=self.start_download).pack(side='left', padx=5)
+        Button(self.btn_frame, text="下载所选一周", command=self.start_week_download).pack(side='left', padx=5)
+        Button(self.btn_frame, text="全部取消", command=self.cancel_all).pack(side='left', padx=5)
         Button(self.btn_frame, text="程序主页", command=lambda: webbrowser.open(help_url)).pack(side='left', padx=5)
-        Button(self.btn_frame, text="退出程序", command=master.quit).pack(side='left', padx=5)
-        
-    
+        Button(self.btn_frame, text="退出程序", command=self.quit).pack(side='left', padx=5)
+        master.protocol('WM_DELETE_WINDOW', self.quit)
+
+        # 每个任务一行：日期与状态、进度条、取消按钮
+        self.jobs_frame = Frame(self.frame)
+        self.jobs_frame.pack(fill='x')
+        self.rows = {}  # 日期 → (行, 状态标签, 进度条, 取消按钮)
+        self.active = set()  # 排队中和进行中的日期
+        self.finished = []  # 本轮已结束的任务 (日期, 类型, 数据)，全部结束后汇总提示
+        self.partial = set()  # 内容不完整的日期，再次下载时只补全失败的页面
+        self._manager = None
+        self.prober = AvailabilityProber()
+        month, year = self.cal.get_displayed_month()
+        self.mark_missing(self.prober.cached(year, month))
+        self.master.after(100, self.poll_events)
+        self._idle_probe = self.master.after(PROBE_IDLE_MS, self.probe_displayed_month)
+
+    @property
+    def manager(self):
+        # 首次下载时才建立(同时导入requests等网络库)，界面可以更快显示
+        if self._manager is None:
+            self._manager = DownloadManager()
+        return self._manager
+
+    def probe_displayed_month(self):
+        if self._idle_probe is not None:  # 用户已翻动日历，不再需要启动时安排的探测
+            self.master.after_cancel(self._idle_probe)
+            self._idle_probe = None
+        month, year = self.cal.get_displayed_month()
+        self.prober.probe_month(year, month, self.prefetch.get())
+
+    def mark_missing(self, found):
+        # 新探测到未发行的日期标为灰色；之前标为未发行、重新探测后已发行的日期取消标记
+        for target_date, available in found.items():
+            if available is False and target_date not in self.missing:
+                self.missing[target_date] = self.cal.calevent_create(
+                    datetime.strptime(target_date, '%Y-%m/%d').date(), '未发行', tags='missing')
+            elif available and target_date in self.missing:
+                self.cal.calevent_remove(self.missing.pop(target_date))
+
     def start_download(self, custom_date=None):
-        def download_thread():
-            target_date = custom_date or self.cal.get_date()
+        self.queue_dates([custom_date or self.cal.get_date()])
+
+    def start_week_download(self):
+        # 所选日期所在的一周(周日至周六，与日历一致)，不含未来的日期
+        selected = datetime.strptime(self.cal.get_date(), '%Y-%m/%d')
+        sunday = selected - timedelta(days=(selected.weekday() + 1) % 7)
+        days = [sunday + timedelta(days=n) for n in range(7)]
+        self.queue_dates([day.strftime('%Y-%m/%d') for day in days if day <= datetime.now()])
+
+    def queue_dates(self, dates):
+        missing = [target_date for target_date in dates if target_date in self.missing]
+        if missing and not messagebox.askyesno("未发行", '\n'.join(
+                format_date_chinese(datetime.strptime(target_date, '%Y-%m/%d')) for target_date in missing)
+                + "\n的报纸尚未发行，仍要下载吗？"):
+            dates = [target_date for target_date in dates if target_date not in self.missing]
+        for target_date in dates:
+            if datetime.strptime(target_date, '%Y-%m/%d') < datetime(2022, 1, 1):
+                messagebox.showwarning("日期错误", "仅支持2022年1月1日及以后的报纸下载")
+                continue
+            if target_date in self.active:
+                continue
+            # 同一日期的上一个任务尚未完全结束时submit会拒绝加入，此时不记入进行中的任务
+            if not self.manager.submit(target_date, retry_failed=target_date in self.partial):
+                continue
+            if target_date in self.rows:
+                self.remove_row(target_date)
+            self.active.add(target_date)
+
+    def add_row(self, target_date):
+        row = Frame(self.jobs_frame)
+        row.pack(fill='x', pady=2)
+        label = Label(row, text=f'{target_date.replace("/", "-")} 排队中', width=22, anchor='w')
+        label.pack(side='left')
+        progress = ttk.Progressbar(row, mode='determinate', length=200)
+        progress.pack(side='left', padx=5)
+        cancel = Button(row, text="取消", command=lambda: self.manager.cancel(target_date))
+        cancel.pack(side='left')
+        self.rows[target_date] = (row, label, progress, cancel)
+
+    def remove_row(self, target_date):
+        self.rows.pop(target_date)[0].destroy()
+
+    def poll_events(self):
+        queues = [self.prober.events] if self._manager is None else [self.prober.events, self._manager.events]
+        for events in queues:
             try:
-                if datetime.strptime(target_date, '%Y-%m/%d') < datetime(2022, 1, 1):
-                    messagebox.showwarning("日期错误", "仅支持2022年1月1日及以后的报纸下载")
-                    return
-                    
-                articles_data, today = fetch_articles(target_date)
-                if articles_data:
-                    create_epub(articles_data, today)
-                    messagebox.showinfo("下载完成", 
-                        f"成功生成《人民日报》{format_date_chinese(datetime.strptime(target_date, '%Y-%m/%d'))}电子版")
-                else:
-                    messagebox.showerror("下载失败", "页面未找到，请确认目标日期的《人民日报》（电子版）是否已发行。")
-            except Exception as e:
-                messagebox.showerror("发生错误", str(e))
-        
-        threading.Thread(target=download_thread).start()
+                while True:
+                    kind, target_date, data = events.get_nowait()
+                    self.handle_event(kind, target_date, data)
+            except queue.Empty:
+                pass
+        self.master.after(100, self.poll_events)
+
+    def handle_event(self, kind, target_date, data):
+        if kind == 'availability':
+            self.mark_missing(data)
+            return
+        if kind == 'queued':
+            self.add_row(target_date)
+            return
+        if target_date not in self.rows:
+            return
+        _, label, progress, cancel = self.rows[target_date]
+        display_date = target_date.replace("/", "-")
+        if kind == 'started':
+            label['text'] = f'{display_date} 下载中'
+        elif kind == 'progress':
+            done, total = data
+            progress['maximum'] = max(total, 1)
+            progress['value'] = done
+            label['text'] = f'{display_date} {done}/{total}'
+        else:
+            label['text'] = f'{display_date} ' + {'done': '已完成', 'partial': '不完整', 'failed': '失败',
+                                                  'cancelled': '已取消'}[kind]
+            if kind == 'done':
+                progress['value'] = progress['maximum']
+            if kind == 'partial':
+                self.partial.add(target_date)
+            elif kind == 'done':
+                self.partial.discard(target_date)
+            cancel['state'] = 'disabled'
+            self.active.discard(target_date)
+            self.finished.append((target_date, kind, data))
+            if not self.active:
+                self.report()
+
+    def report(self):
+        # 所有任务结束后统一提示一次
+        done = [target_date for target_date, kind, _ in self.finished if kind == 'done']
+        failed = [(target_date, message) for target_date, kind, message in self.finished if kind == 'failed']
+        partial = [(target_date, report) for target_date, kind, report in self.finished if kind == 'partial']
+        self.finished = []
+        if failed:
+            messagebox.showerror("下载失败", '\n'.join(
+                f'{format_date_chinese(datetime.strptime(target_date, "%Y-%m/%d"))}：{message}'
+                for target_date, message in failed))
+        elif partial:
+            messagebox.showwarning("内容不完整", '\n'.join(
+                f'{format_date_chinese(datetime.strptime(target_date, "%Y-%m/%d"))}：'
+                f'{len(report["failures"])} 个页面获取失败，完整度 {report["completeness"]:.1%}'
+                for target_date, report in partial) + '\n再次下载这些日期时只会补全缺失的部分。')
+        elif len(done) == 1:
+            messagebox.showinfo("下载完成",
+                f"成功生成《人民日报》{format_date_chinese(datetime.strptime(done[0], '%Y-%m/%d'))}电子版")
+        elif done:
+            messagebox.showinfo("下载完成", f"成功生成《人民日报》{len(done)}期电子版")
+
+    def cancel_all(self):
+        if self._manager is not None:
+            self._manager.cancel()
+
+    def quit(self):
+        self.prober.close()
+        if self._manager is not None:
+            self._manager.close()
+        self.master.quit()
 
 #ico文件base64数据
 ICON_DATA = b'''
@@ -572,12 +2941,176 @@ AAAAAAADwAAAAAAAAAPgAAAAAAAAB/AAAAAAAAAP+AAAAAAAAB/8AAAAAAAAP/8A
 AAAAAAD//+AAAAAAB/8=
 '''
 
-if __name__ == '__main__':
+ICON_PATH = os.path.join(os.path.expanduser('~'), '.pdec', 'pdec.ico')
+
+def icon_path():
+    # 图标只在首次运行时解码写入 ~/.pdec(先写临时文件再替换，不会留下不完整的文件)，之后直接使用
+    if os.path.exists(ICON_PATH):
+        return ICON_PATH
+    data = base64.b64decode(ICON_DATA)
+    os.makedirs(os.path.dirname(ICON_PATH), exist_ok=True)
+    with open(ICON_PATH + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(ICON_PATH + '.tmp', ICON_PATH)
+    return ICON_PATH
+
+def run_gui():
+    _load_gui()
     root = Tk()
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.ico') as tmp_icon:
-        tmp_icon.write(base64.b64decode(ICON_DATA))
-        root.iconbitmap(tmp_icon.name)
+    try:
+        root.iconbitmap(icon_path())
+    except OSError:
+        pass  # 主目录不可写时使用默认图标
     root.style = ttk.Style()
     root.style.theme_use('clam')
     app = DatePickerApp(root)
     root.mainloop()
+
+def run_cli(args):
+    try:
+        dates = expand_date_args(args.dates)
+    except ValueError as e:
+        print(e)
+        return 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    cache = None if args.no_cache else ResponseCache()
+    search_index = SearchIndex(args.index_db) if args.index else None
+    availability = None if args.no_probe else AvailabilityIndex()
+    # 所有日期共用同一个连接池和缓存
+    metrics = Metrics(args.trace)
+    rate_limiter = RateLimiter(args.rate, host_rates=args.host_rate)
+    client = HttpClient(max_workers=args.workers, cache=cache, revalidate=True, metrics=metrics,
+                        rate_limiter=rate_limiter)
+    image_options = image_options_from_args(args)
+    normalizer = None
+    if not args.no_normalize:
+        # 每篇文章的规范化不到1毫秒，交给进程池时序列化和进程间通信的开销反而更大，默认在下载线程中执行
+        normalizer = Normalizer(args.simple_markup, args.normalize_processes)
+    try:
+        if args.compile:
+            results = {}
+            if availability is not None:
+                found = availability.probe(dates, client, args.workers, recheck_missing=args.force)
+                dates = [target_date for target_date in dates if found[target_date] is not False]
+            for group in group_dates(sorted(dates), args.compile):
+                path = create_compilation_epub(group, client, args.output_dir, args.workers, image_options,
+                                               search_index, normalizer)
+                if path:
+                    print(f'已生成 {path}')
+                results[f'{group[0]}..{group[-1]}'] = path
+        else:
+            results = run_batch(dates, client, args.output_dir, args.jobs, args.workers, args.state, args.force,
+                                args.stream, args.incremental, image_options, search_index, args.spool,
+                                availability, args.retry_failed, args.min_completeness, normalizer)
+    finally:
+        client.close()
+        close_image_options(image_options)
+        if normalizer is not None:
+            normalizer.close()
+        if search_index is not None:
+            search_index.close()
+        metrics.close()
+        if args.metrics:
+            with open(args.metrics, 'w', encoding='utf-8') as f:
+                f.write(metrics.prometheus())
+
+    print(client.summary())
+    failed = [target_date for target_date, path in results.items() if not path]
+    partial = [] if args.compile else [target_date for target_date, path in results.items()
+                                       if path and load_manifest(target_date, args.output_dir).get('partial')]
+    if partial:
+        print(f'以下日期内容不完整，可加上 --retry-failed 补全：{", ".join(partial)}')
+    if failed:
+        print(f'以下日期未能生成：{", ".join(failed)}')
+    return 1 if failed or partial else 0
+
+def _host_rate(value):
+    host, separator, rate = value.rpartition('=')
+    try:
+        if not separator or not host:
+            raise ValueError
+        return host, float(rate)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'格式应为 主机名=速率，例如 paper.people.com.cn=5：{value}')
+
+def run_search(args):
+    if not os.path.exists(args.index_db):
+        print(f'索引文件不存在：{args.index_db}，请先使用 --index 生成电子书')
+        return 1
+    search_index = SearchIndex(args.index_db)
+    try:
+        start = time.perf_counter()
+        results = search_index.search(args.search, args.limit)
+        seconds = time.perf_counter() - start
+    finally:
+        search_index.close()
+    for result in results:
+        print(f'{result["date"].replace("/", "-")}  {result["section"]}  {result["title"]}')
+        print(f'    {result["epub"]}#{result["chapter"]}')
+        print(f'    {result["snippet"]}')
+    print(f'共 {len(results)} 条结果，用时 {seconds * 1000:.1f} 毫秒')
+    return 0 if results else 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='从人民日报官网下载指定日期的文章并生成EPUB电子书。不带日期参数运行时打开图形界面。')
+    parser.add_argument('dates', nargs='*',
+                        help='日期，支持 2024-12-01、2024-12/01、20241201、日期范围 2024-11-01..2024-12-31，'
+                             '以及简写形式："-N"(N天前)、"YY MM DD"、"MM DD"、星期数字1-7')
+    parser.add_argument('-o', '--output-dir', default='.', help='EPUB输出目录，默认为当前目录')
+    parser.add_argument('-j', '--workers', type=int, default=MAX_WORKERS, help=f'并发下载线程数，默认 {MAX_WORKERS}')
+    parser.add_argument('--jobs', type=int, default=BATCH_JOBS, help=f'同时处理的报纸期数，默认 {BATCH_JOBS}')
+    parser.add_argument('--state', help=f'批量下载进度文件，默认为输出目录下的 {STATE_FILE}')
+    parser.add_argument('--force', action='store_true', help='即使EPUB已存在也重新生成')
+    parser.add_argument('--compile', nargs='?', const='all', choices=['all', 'month', 'week'],
+                        help='把多天合并为一本电子书：all(全部合并，默认)、month(按月)、week(按周)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量更新：复用已生成EPUB中未变化的文章，只下载新出现和有变化的文章')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='只重新获取上次失败的版面页和文章页，补入已有的EPUB；没有失败页面的日期直接跳过')
+    parser.add_argument('--min-completeness', type=float, default=MIN_COMPLETENESS,
+                        help=f'成功获取的页面比例(0-1)低于此值时标记为不完整并以非零状态退出，默认 {MIN_COMPLETENESS:g}')
+    parser.add_argument('--stream', action='store_true', help='边下载边写入EPUB，内存占用不随报纸篇幅增长')
+    parser.add_argument('--spool', action='store_true', help='下载的正文暂存在临时文件中，生成EPUB时再逐篇读出')
+    parser.add_argument('--images', action='store_true', help='下载文章配图并嵌入电子书')
+    parser.add_argument('--image-max-size', type=int, help='配图的最大边长(像素)，超出时缩小；需要Pillow')
+    parser.add_argument('--grayscale', action='store_true', help='配图转为灰度，适合墨水屏；需要Pillow')
+    parser.add_argument('--jpeg-quality', type=int, help='配图重新编码为JPEG时的质量(1-95)；需要Pillow')
+    parser.add_argument('--no-cache', action='store_true', help='不使用磁盘缓存')
+    parser.add_argument('--no-normalize', action='store_true', help='保留官网正文的原始标记，不做规范化')
+    parser.add_argument('--simple-markup', action='store_true',
+                        help='规范化时只保留段落、图片、换行、加粗、斜体和链接等基本标签')
+    parser.add_argument('--normalize-processes', type=int, default=0, metavar='N',
+                        help='在 N 个进程中做规范化，默认 0，即在下载线程中执行')
+    parser.add_argument('--no-probe', action='store_true',
+                        help=f'不预先探测各日期是否已发行(探测结果缓存在 {AVAILABILITY_FILE})')
+    parser.add_argument('--rate', type=float, default=RATE_LIMIT,
+                        help=f'每个主机的请求速率上限(次/秒)，遇到限流时自动降低，0表示不限速，默认 {RATE_LIMIT:g}')
+    parser.add_argument('--host-rate', type=_host_rate, action='append', default=[], metavar='HOST=RATE',
+                        help='为指定主机单独设置速率上限，可重复使用')
+    parser.add_argument('--trace', metavar='FILE', help='把每次请求与各阶段的耗时以JSON Lines格式追加到文件')
+    parser.add_argument('--metrics', metavar='FILE', help='结束时把计数与耗时统计以Prometheus文本格式写入文件')
+    parser.add_argument('--index', action='store_true', help='把生成的文章写入本地全文索引(已存在的EPUB也会补入索引)')
+    parser.add_argument('--index-db', default=SEARCH_INDEX, help=f'全文索引文件，默认 {SEARCH_INDEX}')
+    parser.add_argument('--search', metavar='QUERY', help='在全文索引中检索，多个词以空格分隔，同时包含各词的文章才会列出')
+    parser.add_argument('--limit', type=int, default=20, help='检索结果的最大条数，默认 20')
+    parser.add_argument('--serve', type=int, nargs='?', const=SERVE_PORT, metavar='PORT',
+                        help=f'启动本地HTTP服务(默认端口 {SERVE_PORT})，按日期和版面按需生成电子书，'
+                             f'例如 /2024-12-01/sections/1-4.epub')
+    parser.add_argument('--bind', default='127.0.0.1', help='服务监听的地址，供局域网内的设备访问时设为 0.0.0.0')
+    parser.add_argument('--serve-cache', type=int, default=SERVE_CACHE_BYTES // (1024 * 1024), metavar='MB',
+                        help=f'服务模式下在内存中缓存的电子书总大小(MB)，默认 {SERVE_CACHE_BYTES // (1024 * 1024)}')
+    args = parser.parse_args(argv)
+
+    if args.serve is not None:
+        return run_server(args)
+    if args.search:
+        return run_search(args)
+    if not args.dates:
+        run_gui()
+        return 0
+    return run_cli(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,318 @@
+# 性能测试：在本地模拟站点(mock_site.py)上测量下载、解析、规范化、去重和生成EPUB的吞吐量。
+# 每项测试在独立的子进程中运行，以便分别记录峰值内存；结果以JSON输出，便于在版本之间比较。
+#     python benchmarks/bench.py                         # 运行默认的测试项
+#     python benchmarks/bench.py fetch_pc build_year -o bench.json --latency 0.05
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import posixpath
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, os.pardir, 'People-sDailyEpubCreator.py')
+sys.path.insert(0, HERE)
+
+from mock_site import MockSite  # noqa: E402
+
+BENCHMARKS = {}
+DEFAULT_BENCHMARKS = ['startup', 'fetch_legacy', 'fetch_pc', 'parse', 'normalize', 'dedup', 'build_day', 'build_month']
+ISSUE_DATES = {'legacy': '2024-11/29', 'pc': '2024-12/02'}
+# 命令行与图形界面启动时不应导入的库，首次下载、解析或打开界面时才加载
+HEAVY_MODULES = ['requests', 'urllib3', 'lxml', 'ebooklib', 'tkinter', 'tkcalendar', 'PIL']
+STARTUP_PROBE = f'''
+import importlib.util, json, sys, time
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('pdec', {SCRIPT!r})
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+print(json.dumps({{'import_ms': (time.perf_counter() - start) * 1000,
+                  'heavy_modules': [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+'''
+
+
+def benchmark(name):
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def load_pdec():
+    spec = importlib.util.spec_from_file_location('pdec', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['pdec'] = module  # 进程池的子进程按模块名查找规范化函数
+    spec.loader.exec_module(module)
+    return module
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def _fetch(pdec, args, layout):
+    with MockSite(args.sections, args.articles, latency=args.latency, error_rate=args.error_rate) as site:
+        pdec.SITE_ROOT = site.url
+        client = pdec.HttpClient(max_workers=args.workers, backoff=0.01, rate_limiter=pdec.RateLimiter(args.rate))
+        start = time.perf_counter()
+        articles_data, _ = pdec.fetch_articles(ISSUE_DATES[layout], args.workers, client)
+        seconds = time.perf_counter() - start
+        client.close()
+    return {'seconds': seconds, 'pages': site.requests, 'pages_per_second': site.requests / seconds,
+            'articles': len(articles_data), 'retries': client.stats['retries'], 'failures': client.stats['failures']}
+
+
+@benchmark('fetch_legacy')
+def bench_fetch_legacy(pdec, args):
+    return _fetch(pdec, args, 'legacy')
+
+
+@benchmark('fetch_pc')
+def bench_fetch_pc(pdec, args):
+    return _fetch(pdec, args, 'pc')
+
+
+@benchmark('parse')
+def bench_parse(pdec, args):
+    site = MockSite(args.sections, args.articles)
+    result = {}
+    for layout_name, today in ISSUE_DATES.items():
+        layout = pdec.get_layout(today)
+        base_url = layout.base_url(today)
+        section_page = site.render(url_path(layout.index_url(today))).encode('utf-8')
+        article_url = layout.parse_section(section_page, base_url)[0][1]
+        article_page = site.render(url_path(article_url)).encode('utf-8')
+        # article_full 为关闭 PARTIAL_PARSE、解析整个文章页的对照组
+        for kind, parse, partial in (('index', lambda: layout.parse_index(section_page, base_url), True),
+                                     ('section', lambda: layout.parse_section(section_page, base_url), True),
+                                     ('article', lambda: layout.parse_article(article_page, article_url), True),
+                                     ('article_full', lambda: layout.parse_article(article_page, article_url), False)):
+            pdec.PARTIAL_PARSE = partial
+            start = time.perf_counter()
+            for _ in range(args.iterations):
+                parse()
+            seconds = time.perf_counter() - start
+            result[f'{layout_name}_{kind}_pages_per_second'] = args.iterations / seconds
+    pdec.PARTIAL_PARSE = True
+    return result
+
+
+@benchmark('normalize')
+def bench_normalize(pdec, args):
+    # 对一期文章的正文做规范化，比较在本进程中执行与交给进程池执行的吞吐量，以及正文缩小的比例
+    contents = [article.content for article in synthetic_articles(pdec, 1, args.sections * args.articles)]
+    result = {'articles': len(contents), 'bytes_before': sum(len(content.encode('utf-8')) for content in contents)}
+    for kind, processes in (('inline', 0), ('pool', os.cpu_count() or 1)):
+        normalizer = pdec.Normalizer(processes=processes)
+        normalizer(contents[0])  # 预热进程池
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.workers) as executor:
+            normalized = list(executor.map(normalizer, contents))
+        seconds = time.perf_counter() - start
+        normalizer.close()
+        result[f'{kind}_articles_per_second'] = len(contents) / seconds
+    result['bytes_after'] = sum(len(content.encode('utf-8')) for content in normalized)
+    return result
+
+
+def url_path(url):
+    return posixpath.normpath(urlsplit(url).path)
+
+
+def synthetic_articles(pdec, days, articles_per_day, spool=None):
+    # 不经网络，直接用模拟站点的文章页生成Article；spool为ArticleSpool时正文写入临时文件
+    sections = 20
+    site = MockSite(sections, max(articles_per_day // sections, 1))
+    layout = pdec.get_layout(ISSUE_DATES['pc'])
+    start_date = datetime(2024, 12, 1)
+    for day in range(days):
+        date = start_date + timedelta(days=day)
+        for section_no in range(1, site.sections + 1):
+            for article_no in range(1, site.articles + 1):
+                page = site.render_article('pc', date, section_no, article_no).encode('utf-8')
+                content = layout.parse_article(page, f'http://localhost/content_{section_no * 1000 + article_no}.html')
+                yield pdec.Article(
+                    sys.intern(f'第{section_no:02d}版'), f'{date:%m%d} 第{section_no}版第{article_no}篇',
+                    spool.write(content) if spool is not None else content,
+                    f'{section_no}_{article_no}.xhtml' if days == 1 else f'{date:%Y%m%d}_{section_no}_{article_no}.xhtml',
+                    spool)
+
+
+@benchmark('dedup')
+def bench_dedup(pdec, args):
+    articles = list(synthetic_articles(pdec, 1, args.sections * args.articles))
+    articles = articles * 10  # 90%为重复文章
+    start = time.perf_counter()
+    seen = set()
+    duplicates = 0
+    for article in articles:
+        digest = pdec.content_digest(article.title, article.content)
+        if digest in seen:
+            duplicates += 1
+        seen.add(digest)
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'articles': len(articles), 'articles_per_second': len(articles) / seconds,
+            'duplicates': duplicates}
+
+
+def _build(pdec, args, days):
+    with tempfile.TemporaryDirectory() as output_dir:
+        today = ISSUE_DATES['pc']
+        spool = pdec.ArticleSpool() if args.spool else None
+        if args.streaming:
+            start = time.perf_counter()
+            path = pdec.create_epub_streaming(synthetic_articles(pdec, days, 100), today, output_dir)
+        else:
+            articles_data = list(synthetic_articles(pdec, days, 100, spool))
+            start = time.perf_counter()
+            path = pdec.create_epub(articles_data, today, output_dir)
+        seconds = time.perf_counter() - start
+        size = os.path.getsize(path)
+        if spool is not None:
+            spool.close()
+    return {'seconds': seconds, 'articles': days * 100, 'articles_per_second': days * 100 / seconds,
+            'epub_bytes': size, 'streaming': args.streaming, 'spool': args.spool}
+
+
+@benchmark('build_day')
+def bench_build_day(pdec, args):
+    return _build(pdec, args, 1)
+
+
+@benchmark('build_month')
+def bench_build_month(pdec, args):
+    return _build(pdec, args, 30)
+
+
+@benchmark('build_year')
+def bench_build_year(pdec, args):
+    return _build(pdec, args, 365)
+
+
+@benchmark('search')
+def bench_search(pdec, args):
+    # 用同一天的文章模拟 --issues 期报纸，测量逐期写入索引和检索的耗时
+    articles = [(article.section, article.title, pdec._article_text(article.content), article.filename)
+                for article in synthetic_articles(pdec, 1, 100)]
+    queries = ['数字化', '体制机制 活力', '推', '工业增加值', '不存在的词语']
+    with tempfile.TemporaryDirectory() as output_dir:
+        index = pdec.SearchIndex(os.path.join(output_dir, 'search.db'))
+        start_date = datetime(2022, 1, 1)
+        start = time.perf_counter()
+        for day in range(args.issues):
+            index.add_issue(f'{start_date + timedelta(days=day):%Y-%m/%d}', 'bench.epub', articles)
+        index_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.iterations // 10):
+            for query in queries:
+                index.search(query)
+        query_seconds = (time.perf_counter() - start) / (args.iterations // 10 * len(queries))
+        index.close()
+        size = os.path.getsize(os.path.join(output_dir, 'search.db'))
+    return {'issues': args.issues, 'articles': args.issues * len(articles),
+            'index_seconds_per_issue': index_seconds / args.issues, 'query_ms': query_seconds * 1000,
+            'index_bytes': size}
+
+
+@benchmark('startup')
+def bench_startup(pdec, args):
+    # 冷启动：导入模块的耗时与是否加载了重型库(各在新的解释器中测量，取中位数)，
+    # 以及运行 --help 的总耗时(含解释器启动和编译脚本)。超出 --startup-budget 时本测试项记为未通过
+    imports = []
+    help_seconds = []
+    for _ in range(args.startup_runs):
+        process = subprocess.run([sys.executable, '-c', STARTUP_PROBE], capture_output=True, text=True, check=True)
+        imports.append(json.loads(process.stdout))
+        start = time.perf_counter()
+        subprocess.run([sys.executable, SCRIPT, '--help'], capture_output=True, check=True)
+        help_seconds.append(time.perf_counter() - start)
+    import_ms = sorted(result['import_ms'] for result in imports)[len(imports) // 2]
+    heavy_modules = sorted({name for result in imports for name in result['heavy_modules']})
+    return {'import_ms': import_ms, 'help_ms': sorted(help_seconds)[len(help_seconds) // 2] * 1000,
+            'heavy_modules': heavy_modules, 'budget_ms': args.startup_budget,
+            'within_budget': import_ms <= args.startup_budget and not heavy_modules}
+
+
+def run_one(name, args):
+    pdec = load_pdec()
+    result = BENCHMARKS[name](pdec, args)
+    result['name'] = name
+    result['peak_rss_kb'] = peak_rss_kb()
+    return result
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='PDEC性能测试，结果以JSON输出')
+    parser.add_argument('benchmarks', nargs='*',
+                        help=f'要运行的测试项：{" ".join(BENCHMARKS)}，默认 {" ".join(DEFAULT_BENCHMARKS)}')
+    parser.add_argument('-o', '--output', help='把结果写入文件，默认输出到标准输出')
+    parser.add_argument('--sections', type=int, default=20, help='每期版面数')
+    parser.add_argument('--articles', type=int, default=5, help='每个版面的文章数')
+    parser.add_argument('--latency', type=float, default=0.02, help='模拟站点每次请求的延迟(秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模拟站点返回503的概率')
+    parser.add_argument('--workers', type=int, default=8, help='并发下载线程数')
+    parser.add_argument('--rate', type=float, default=0, help='每个主机的请求速率上限(次/秒)，默认不限速')
+    parser.add_argument('--iterations', type=int, default=200, help='解析测试的重复次数')
+    parser.add_argument('--issues', type=int, default=1000, help='检索测试中索引的报纸期数')
+    parser.add_argument('--streaming', action='store_true', help='生成测试使用边下载边写入的EPUB写入器')
+    parser.add_argument('--spool', action='store_true', help='生成测试把正文暂存在临时文件中')
+    parser.add_argument('--startup-runs', type=int, default=5, help='启动测试的重复次数')
+    parser.add_argument('--startup-budget', type=float, default=80, help='导入模块耗时的上限(毫秒)')
+    parser.add_argument('--run', help=argparse.SUPPRESS)  # 子进程内部使用
+    args = parser.parse_args()
+
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f'未知的测试项：{" ".join(unknown)}')
+    if args.run:
+        print(json.dumps(run_one(args.run, args)))
+        return
+
+    child_args = [arg for arg in sys.argv[1:] if arg not in BENCHMARKS]
+    if '-o' in child_args or '--output' in child_args:
+        flag = '-o' if '-o' in child_args else '--output'
+        index = child_args.index(flag)
+        del child_args[index:index + 2]
+    results = []
+    for name in args.benchmarks or DEFAULT_BENCHMARKS:
+        process = subprocess.run([sys.executable, __file__, '--run', name] + child_args,
+                                 capture_output=True, text=True)
+        if process.returncode != 0:
+            results.append({'name': name, 'error': process.stderr.strip().splitlines()[-1:]})
+            continue
+        results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+        print(f'{name}: {results[-1]}', file=sys.stderr)
+
+    report = {'version': git_version(), 'python': platform.python_version(), 'platform': platform.platform(),
+              'timestamp': datetime.now().isoformat(timespec='seconds'), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    # 有测试项出错或超出预算时以非零状态退出，便于在持续集成中使用
+    if any('error' in result or result.get('within_budget') is False for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
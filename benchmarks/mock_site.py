@@ -0,0 +1,193 @@
+# 本地模拟的人民日报电子版站点，用于性能测试和离线调试。
+# 按 fixtures/ 中的页面模板为任意日期生成两种版式(2024年12月1日改版前后)的首页、版面页、文章页和配图，
+# 可设置每次请求的延迟和出错概率。单独运行时作为HTTP服务启动：
+#     python benchmarks/mock_site.py --port 8000 --latency 0.05
+#     PDEC_SITE_ROOT=http://127.0.0.1:8000 python People-sDailyEpubCreator.py 2024-12-01
+import argparse
+import base64
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# 1x1像素的PNG，作为所有配图的内容
+PIXEL_PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==')
+
+SECTION_NAMES = ['要闻', '要闻', '要闻', '要闻', '评论', '政治', '经济', '社会', '文化', '国际',
+                 '视点', '理论', '副刊', '体育', '生态', '读者来信', '科技', '教育', '健康', '广告']
+
+SENTENCES = ['坚持以人民为中心的发展思想，不断满足人民日益增长的美好生活需要。',
+             '各地区各部门认真贯彻落实党中央决策部署，推动经济持续回升向好。',
+             '记者在采访中了解到，当地通过数字化改造大幅提升了生产效率。',
+             '专家认为，要进一步完善体制机制，激发各类经营主体活力。',
+             '这一做法得到了群众的普遍认可，相关经验正在全国推广。',
+             '据统计，今年前三季度全国规模以上工业增加值同比增长百分之五点八。']
+
+_LEGACY_SECTION = re.compile(r'/rmrb/html/(\d{4})-(\d{2})/(\d{2})/nbs\.D110000renmrb_(\d+)\.htm$')
+_LEGACY_ARTICLE = re.compile(r'/rmrb/html/(\d{4})-(\d{2})/(\d{2})/nw\.D110000renmrb_\d{8}_(\d+)-(\d+)\.htm$')
+_PC_SECTION = re.compile(r'/rmrb/pc/layout/(\d{4})(\d{2})/(\d{2})/node_(\d+)\.html$')
+_PC_ARTICLE = re.compile(r'/rmrb/pc/content/(\d{4})(\d{2})/(\d{2})/content_(\d+)\.html$')
+
+
+def _load_template(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return Template(f.read())
+
+
+class MockSite:
+    def __init__(self, sections=20, articles=5, paragraphs=12, latency=0.0, error_rate=0.0, seed=0):
+        self.sections = sections
+        self.articles = articles
+        self.paragraphs = paragraphs
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._templates = {name: _load_template(name) for name in os.listdir(FIXTURES)}
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self, port=0):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.do_GET(send_body=False)
+
+            def do_GET(self, send_body=True):
+                status, content_type, body = site.handle(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def handle(self, path):
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            return 503, 'text/plain', b'Service Unavailable'
+
+        body = self.render(path.split('?')[0])
+        if body is None:
+            return 404, 'text/plain', b'Not Found'
+        if isinstance(body, bytes):
+            return 200, 'image/png', body
+        return 200, 'text/html; charset=utf-8', body.encode('utf-8')
+
+    def render(self, path):
+        if '/pic/' in path:
+            return PIXEL_PNG
+        for pattern, layout, kind in ((_LEGACY_SECTION, 'legacy', 'section'), (_LEGACY_ARTICLE, 'legacy', 'article'),
+                                      (_PC_SECTION, 'pc', 'section'), (_PC_ARTICLE, 'pc', 'article')):
+            match = pattern.search(path)
+            if not match:
+                continue
+            year, month, day = map(int, match.groups()[:3])
+            date = datetime(year, month, day)
+            if kind == 'section':
+                return self.render_section(layout, date, int(match.group(4)))
+            if layout == 'legacy':
+                article_no, section_no = int(match.group(4)), int(match.group(5))
+            else:
+                section_no, article_no = divmod(int(match.group(4)), 1000)
+            return self.render_article(layout, date, section_no, article_no)
+        return None
+
+    def _fields(self, date, section_no):
+        return {'year_month': f'{date:%Y-%m}', 'day': f'{date:%d}', 'date_compact': f'{date:%Y%m%d}',
+                'date_text': f'{date.year}年{date.month:02d}月{date.day:02d}日', 'section_no': f'{section_no:02d}'}
+
+    def render_section(self, layout, date, section_no):
+        if not 1 <= section_no <= self.sections:
+            return None
+        section_links = []
+        for n in range(1, self.sections + 1):
+            href = f'./nbs.D110000renmrb_{n:02d}.htm' if layout == 'legacy' else f'node_{n:02d}.html'
+            name = SECTION_NAMES[(n - 1) % len(SECTION_NAMES)]
+            section_links.append(f'\n        <div class="swiper-slide"><a id="pageLink" href="{href}">第{n:02d}版：{name}</a></div>')
+        article_links = []
+        for k in range(1, self.articles + 1):
+            if layout == 'legacy':
+                href = f'nw.D110000renmrb_{date:%Y%m%d}_{k}-{section_no:02d}.htm'
+            else:
+                href = f'../../../content/{date:%Y%m}/{date:%d}/content_{section_no * 1000 + k}.html'
+            article_links.append(f'\n        <li><a href="{href}">第{section_no}版第{k}篇文章的标题</a></li>')
+        # 每个版面末尾转载一篇头版文章，模拟跨版面的重复链接
+        if section_no > 1 and self.articles:
+            href = (f'nw.D110000renmrb_{date:%Y%m%d}_1-01.htm' if layout == 'legacy'
+                    else f'../../../content/{date:%Y%m}/{date:%d}/content_1001.html')
+            article_links.append(f'\n        <li><a href="{href}">第1版第1篇文章的标题</a></li>')
+        template = self._templates['legacy_section.htm' if layout == 'legacy' else 'pc_section.html']
+        return template.substitute(self._fields(date, section_no), section_links=''.join(section_links),
+                                   article_links=''.join(article_links))
+
+    def render_article(self, layout, date, section_no, article_no):
+        if not (1 <= section_no <= self.sections and 1 <= article_no <= self.articles):
+            return None
+        rng = random.Random(f'{date:%Y%m%d}-{section_no}-{article_no}')
+        paragraphs = ''.join(
+            f'\n          <p style="text-indent: 2em;">　　{"".join(rng.choice(SENTENCES) for _ in range(4))}'
+            f'{"<b>（新华社发）</b>" if i == 0 else ""}</p>'
+            for i in range(self.paragraphs))
+        template = self._templates['legacy_article.htm' if layout == 'legacy' else 'pc_article.html']
+        return template.substitute(self._fields(date, section_no), title=f'第{section_no}版第{article_no}篇文章的标题',
+                                   article_no=f'{article_no:02d}', caption='图为当地群众参加活动。新华社记者 摄',
+                                   paragraphs=paragraphs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动本地模拟的人民日报电子版站点')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--sections', type=int, default=20)
+    parser.add_argument('--articles', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help='每次请求的延迟(秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回503的概率')
+    args = parser.parse_args()
+    site = MockSite(args.sections, args.articles, latency=args.latency, error_rate=args.error_rate).start(args.port)
+    print(f'模拟站点已启动：{site.url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        site.stop()
+
+
+if __name__ == '__main__':
+    main()
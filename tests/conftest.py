@@ -0,0 +1,54 @@
+# 测试在 benchmarks/mock_site.py 模拟的站点上运行，不访问网络。
+#     python -m pytest tests
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from mock_site import MockSite  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def pdec(tmp_path_factory):
+    # 缓存、索引等默认路径在导入时由HOME确定，导入前指向临时目录
+    home = str(tmp_path_factory.mktemp('home'))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('HOME', home)
+        patch.setenv('USERPROFILE', home)
+        spec = importlib.util.spec_from_file_location('pdec', os.path.join(ROOT, 'People-sDailyEpubCreator.py'))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules['pdec'] = module
+        spec.loader.exec_module(module)
+    module.default_rate_limiter.rate = 0
+    return module
+
+
+@pytest.fixture
+def site(pdec):
+    # 每个版面3篇文章，第2版起各版末尾转载头版第1篇；site.paths 记录收到的请求路径
+    mock = MockSite(sections=3, articles=3, paragraphs=2)
+    mock.paths = []
+    handle = mock.handle
+
+    def recording_handle(path):
+        mock.paths.append(path)
+        return handle(path)
+
+    mock.handle = recording_handle
+    mock.article_requests = lambda: [path for path in mock.paths if '/content/' in path or '/nw.' in path]
+    with mock:
+        site_root, pdec.SITE_ROOT = pdec.SITE_ROOT, mock.url
+        yield mock
+        pdec.SITE_ROOT = site_root
+
+
+@pytest.fixture
+def build(pdec, tmp_path):
+    # 以命令行方式生成到临时目录，返回退出码
+    def run(target_date, *args, output_dir=tmp_path):
+        return pdec.main([target_date, '-o', str(output_dir), '--rate', '0', '--no-probe', *args])
+    return run
@@ -0,0 +1,55 @@
+# 发行探测：已发行的结果一直有效，未发行的结果过期或 --force 时重新探测，最近几天的未发行结果不保存
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+MISSING = '2024-12/01'
+
+
+@pytest.fixture
+def missing(site):
+    # 集合中日期的页面返回404
+    dates = {MISSING}
+    handle = site.handle
+    site.handle = lambda path: (404, 'text/plain', b'Not Found') if any(
+        '/' + d.replace('-', '') + '/' in path for d in dates) else handle(path)
+    return dates
+
+
+def test_missing_results_expire(pdec, site, missing, tmp_path):
+    path = str(tmp_path / 'availability.json')
+    client = pdec.HttpClient()
+    index = pdec.AvailabilityIndex(path)
+    assert index.probe([MISSING, '2024-12/02'], client) == {MISSING: False, '2024-12/02': True}
+
+    index = pdec.AvailabilityIndex(path)
+    assert index.get(MISSING) is False and index.get('2024-12/02') is True
+    # 报纸后来补上传：缓存的结果仍有效时不再请求，--force 时重新探测
+    missing.clear()
+    site.paths.clear()
+    assert index.probe([MISSING], client) == {MISSING: False}
+    assert site.paths == []
+    assert index.probe([MISSING], client, recheck_missing=True) == {MISSING: True}
+    assert pdec.AvailabilityIndex(path).get(MISSING) is True
+
+    # 过期的和旧版本保存的未发行结果视为未探测
+    index.entries['2024-11/30'] = time.time() - (pdec.MISSING_TTL_DAYS + 1) * 86400
+    index.entries['2024-11/29'] = False
+    assert index.get('2024-11/30') is None and index.get('2024-11/29') is None
+    client.close()
+
+
+def test_recent_missing_results_are_not_kept(pdec, site, missing, tmp_path):
+    today = datetime.now().strftime('%Y-%m/%d')
+    missing.add(today)
+    path = str(tmp_path / 'availability.json')
+    client = pdec.HttpClient()
+    index = pdec.AvailabilityIndex(path)
+    assert index.probe([today], client) == {today: False}
+    # 长时间运行的图形界面再次翻到这个月时会重新探测
+    assert index.get(today) is None
+    with open(path, encoding='utf-8') as f:
+        assert today not in json.load(f)
+    client.close()
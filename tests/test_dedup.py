@@ -0,0 +1,39 @@
+# 文章去重：同一URL只请求一次，内容相同的文章只保存一份，跨版面的重复保留为目录中的交叉引用
+import zipfile
+
+import mock_site
+
+ISSUE = '2024-12/02'
+
+
+def test_duplicates_by_url_and_digest(pdec, site, build, tmp_path, monkeypatch):
+    monkeypatch.setattr(mock_site, 'SECTION_NAMES', ['要闻', '评论', '国际'])
+    render_section, render_article = site.render_section, site.render_article
+
+    # 第2版第3篇与第1版第2篇URL不同，标题和正文相同
+    def reprinted_section(layout, date, section_no):
+        return render_section(layout, date, section_no).replace('第2版第3篇文章的标题', '第1版第2篇文章的标题')
+
+    def reprinted_article(layout, date, section_no, article_no):
+        if (section_no, article_no) == (2, 3):
+            return render_article(layout, date, 1, 2)
+        return render_article(layout, date, section_no, article_no)
+
+    site.render_section, site.render_article = reprinted_section, reprinted_article
+    assert build(ISSUE, '--no-cache') == 0
+
+    # 各版末尾转载的头版第1篇只请求一次
+    requests = site.article_requests()
+    assert len(requests) == len(set(requests)) == 9
+
+    manifest = pdec.load_manifest(ISSUE, str(tmp_path))
+    duplicates = {(article['section'], article['url'].rsplit('/', 1)[1]): article['filename']
+                  for article in manifest['articles'] if article.get('duplicate')}
+    assert duplicates == {('评论', 'content_1001.html'): '1_1.xhtml', ('评论', 'content_2003.html'): '1_2.xhtml',
+                          ('国际', 'content_1001.html'): '1_1.xhtml'}
+    with zipfile.ZipFile(pdec.epub_path(ISSUE, str(tmp_path))) as zf:
+        names = zf.namelist()
+        nav = zf.read('EPUB/nav.xhtml').decode('utf-8')
+    # 重复文章不单独成章，目录中指向首次出现的章节
+    assert 'EPUB/1_2.xhtml' in names and 'EPUB/2_3.xhtml' not in names and 'EPUB/2_4.xhtml' not in names
+    assert nav.count('href="1_1.xhtml"') == 3 and nav.count('href="1_2.xhtml"') == 2
@@ -0,0 +1,40 @@
+# 配图：只写入正文引用到的图片，合集中各天的相同图片只保存一份
+import zipfile
+
+import mock_site
+
+
+def images_in(path):
+    with zipfile.ZipFile(path) as zf:
+        return sorted(name for name in zf.namelist() if '/images/' in name)
+
+
+def test_unreferenced_images_are_not_written(pdec, tmp_path):
+    for streaming in (False, True):
+        output_dir = tmp_path / ('stream' if streaming else 'book')
+        output_dir.mkdir()
+        client = pdec.HttpClient()
+        images = pdec.ImageStore(client)
+        images.add_existing('images/used.png', mock_site.PIXEL_PNG)
+        # 例如所属文章因重复被去掉时，图片已下载但没有章节引用
+        images.add_existing('images/orphan.png', mock_site.PIXEL_PNG + b'\0')
+        articles = [pdec.Article('要闻', '标题', '<p><img src="images/used.png"/></p>', '1_1.xhtml')]
+        if streaming:
+            path = pdec.create_epub_streaming(iter(articles), '2024-12/02', str(output_dir), images)
+        else:
+            path = pdec.create_epub(articles, '2024-12/02', str(output_dir), images)
+        images.close()
+        client.close()
+        assert images_in(path) == ['EPUB/images/used.png']
+
+
+def test_compilation_stores_each_image_once(pdec, site, build, tmp_path):
+    assert build('2024-12-02..2024-12-03', '--compile', '--images', '--no-cache') == 0
+    (path,) = tmp_path.glob('*.epub')
+    with zipfile.ZipFile(path) as zf:
+        names = zf.namelist()
+        chapter = zf.read('EPUB/20241203/1_1.xhtml').decode('utf-8')
+    # 模拟站点的配图内容都相同
+    assert [name for name in names if 'images/' in name] == [name for name in names if name.startswith('EPUB/images/')]
+    assert len(images_in(path)) == 1
+    assert 'src="../images/' in chapter
@@ -0,0 +1,48 @@
+# 增量更新(--incremental)：最终版本的文章直接复用，出版当天生成的文章逐篇确认，有变化的才替换
+import os
+import zipfile
+from datetime import datetime
+
+PAST_ISSUE = '2024-12-02'
+
+
+def chapters(path):
+    with zipfile.ZipFile(path) as zf:
+        return {name: zf.read(name) for name in zf.namelist() if name.endswith('.xhtml')}
+
+
+def test_final_issue_is_reused_without_article_requests(pdec, site, build, tmp_path):
+    assert build(PAST_ISSUE, '--no-cache') == 0
+    manifest = pdec.load_manifest('2024-12/02', str(tmp_path))
+    assert manifest['final'] is True
+
+    site.paths.clear()
+    assert build(PAST_ISSUE, '--no-cache', '--incremental', '--force') == 0
+    assert site.article_requests() == []
+
+
+def test_issue_day_build_picks_up_edited_article(pdec, site, build, tmp_path):
+    today = datetime.now().strftime('%Y-%m-%d')
+    assert build(today, '--no-cache') == 0
+    epub = pdec.epub_path(datetime.now().strftime('%Y-%m/%d'), str(tmp_path))
+    assert pdec.load_manifest(datetime.now().strftime('%Y-%m/%d'), str(tmp_path))['final'] is False
+    before = chapters(epub)
+
+    render_article = site.render_article
+
+    def edited(layout, date, section_no, article_no):
+        page = render_article(layout, date, section_no, article_no)
+        return page.replace('</p>\n        </div>', '（更正）</p>\n        </div>') if (section_no, article_no) == (2, 2) else page
+
+    site.render_article = edited
+    assert build(today, '--no-cache', '--incremental', '--force') == 0
+    after = chapters(epub)
+    changed = [name for name in before if before[name] != after[name]]
+    assert changed == ['EPUB/2_2.xhtml']
+    assert '（更正）' in after['EPUB/2_2.xhtml'].decode('utf-8')
+
+    # 与不使用增量更新、重新生成的结果逐字节相同
+    incremental = open(epub, 'rb').read()
+    os.remove(epub)
+    assert build(today, '--no-cache') == 0
+    assert open(epub, 'rb').read() == incremental
@@ -0,0 +1,35 @@
+# 正文规范化方式记入清单；改变方式后增量更新不复用旧章节，结果与重新生成的相同
+import os
+
+ISSUE = '2024-12-02'
+
+
+def test_markup_change_refetches_articles(pdec, site, build, tmp_path):
+    assert build(ISSUE, '--no-cache', '--no-normalize') == 0
+    manifest = pdec.load_manifest('2024-12/02', str(tmp_path))
+    assert manifest['markup'] == 'raw' and manifest['final'] is True
+
+    site.paths.clear()
+    assert build(ISSUE, '--no-cache', '--incremental', '--force') == 0
+    assert len(site.article_requests()) == 9
+    assert pdec.load_manifest('2024-12/02', str(tmp_path))['markup'] == 'normalized'
+
+    epub = pdec.epub_path('2024-12/02', str(tmp_path))
+    incremental = open(epub, 'rb').read()
+    os.remove(epub)
+    assert build(ISSUE, '--no-cache') == 0
+    assert open(epub, 'rb').read() == incremental
+
+
+def test_manifest_without_markup_is_raw(pdec, site, build, tmp_path):
+    # 规范化成为默认之前生成的清单没有markup字段
+    assert build(ISSUE, '--no-cache', '--no-normalize') == 0
+    path = pdec.manifest_path('2024-12/02', str(tmp_path))
+    manifest = pdec.load_manifest('2024-12/02', str(tmp_path))
+    del manifest['markup']
+    pdec.save_manifest(manifest, '2024-12/02', str(tmp_path))
+    assert os.path.exists(path)
+
+    site.paths.clear()
+    assert build(ISSUE, '--no-cache', '--no-normalize', '--incremental', '--force') == 0
+    assert site.article_requests() == []
@@ -0,0 +1,28 @@
+# 可重现的生成结果：相同内容在不同目录、不同时间生成的EPUB逐字节相同，内容未变化时不替换已有文件
+import os
+import time
+
+import pytest
+
+ISSUE = '2024-12-02'
+
+
+@pytest.mark.parametrize('options', [(), ('--stream',), ('--images',)])
+def test_builds_are_byte_identical(pdec, site, build, tmp_path, options):
+    first, second = tmp_path / 'first', tmp_path / 'second'
+    assert build(ISSUE, '--no-cache', *options, output_dir=first) == 0
+    time.sleep(1.1)  # ZIP中的时间精确到2秒，跨过秒边界也不应影响结果
+    assert build(ISSUE, '--no-cache', *options, output_dir=second) == 0
+    epub = os.path.basename(pdec.epub_path('2024-12/02'))
+    assert (first / epub).read_bytes() == (second / epub).read_bytes()
+
+
+def test_unchanged_rebuild_keeps_file(pdec, site, build, tmp_path, capsys):
+    assert build(ISSUE, '--no-cache') == 0
+    epub = pdec.epub_path('2024-12/02', str(tmp_path))
+    os.utime(epub, (1_000_000_000, 1_000_000_000))
+    capsys.readouterr()
+    assert build(ISSUE, '--no-cache', '--force') == 0
+    assert '内容未变化' in capsys.readouterr().out
+    assert os.path.getmtime(epub) == 1_000_000_000
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
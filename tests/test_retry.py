@@ -0,0 +1,49 @@
+# 获取失败的页面记入清单，电子书标记为不完整；--retry-failed 只重新获取失败的页面
+import os
+
+import pytest
+
+ISSUE = '2024-12-02'
+FAILED_PAGES = ('/layout/202412/02/node_03.html', '/content/202412/02/content_2002.html')
+
+
+@pytest.fixture
+def failing(site):
+    # 集合中的页面返回404(不重试)，清空后恢复正常
+    pages = set(FAILED_PAGES)
+    handle = site.handle
+    site.handle = lambda path: (404, 'text/plain', b'Not Found') if any(path.endswith(page) for page in pages) \
+        else handle(path)
+    return pages
+
+
+def test_partial_build_and_retry(pdec, site, build, tmp_path, failing):
+    assert build(ISSUE, '--no-cache') == 1
+    manifest = pdec.load_manifest('2024-12/02', str(tmp_path))
+    assert manifest['partial'] is True and manifest['final'] is True
+    assert sorted((failure['kind'], failure['url'].rsplit('/', 1)[1]) for failure in manifest['failures']) == \
+        [('article', 'content_2002.html'), ('section', 'node_03.html')]
+    assert round(pdec.issue_completeness(manifest), 4) == manifest['completeness'] < 1
+
+    failing.clear()
+    site.paths.clear()
+    assert build(ISSUE, '--no-cache', '--retry-failed') == 0
+    # 首页和已获取的版面页不再请求，已有的文章直接复用
+    assert sorted(path.rsplit('/', 1)[1] for path in site.paths) == \
+        ['content_2002.html', 'content_3001.html', 'content_3002.html', 'content_3003.html', 'node_03.html']
+    manifest = pdec.load_manifest('2024-12/02', str(tmp_path))
+    assert manifest['failures'] == [] and manifest['partial'] is False and manifest['completeness'] == 1
+
+    # 补全后的结果与一次成功生成的逐字节相同
+    epub = pdec.epub_path('2024-12/02', str(tmp_path))
+    retried = open(epub, 'rb').read()
+    os.remove(epub)
+    assert build(ISSUE, '--no-cache') == 0
+    assert open(epub, 'rb').read() == retried
+
+
+def test_retry_skips_complete_issues(pdec, site, build, tmp_path):
+    assert build(ISSUE, '--no-cache') == 0
+    site.paths.clear()
+    assert build(ISSUE, '--no-cache', '--retry-failed') == 0
+    assert site.paths == []
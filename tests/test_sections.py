@@ -0,0 +1,38 @@
+# 按版面生成：版次写法的解析与格式化，只请求指定版面的页面
+import io
+import re
+import zipfile
+
+import pytest
+
+
+@pytest.mark.parametrize('spec, numbers', [('3', {3}), ('1-4', {1, 2, 3, 4}), ('1-4,7', {1, 2, 3, 4, 7}),
+                                           ('7,1-2,2', {1, 2, 7}), ('5-5', {5})])
+def test_parse_section_spec(pdec, spec, numbers):
+    assert pdec.parse_section_spec(spec) == numbers
+
+
+@pytest.mark.parametrize('spec', ['', '0', '4-1', 'a', '1,,2', '1000', '-3'])
+def test_parse_section_spec_rejects(pdec, spec):
+    with pytest.raises(ValueError):
+        pdec.parse_section_spec(spec)
+
+
+@pytest.mark.parametrize('spec, formatted', [('1-4,7', '1-4,7'), ('7,1-2,2', '1-2,7'), ('3', '3'), ('1,3,5', '1,3,5')])
+def test_format_section_spec(pdec, spec, formatted):
+    assert pdec.format_section_spec(pdec.parse_section_spec(spec)) == formatted
+
+
+def test_build_sections_requests_only_selected(pdec, site):
+    client = pdec.HttpClient()
+    data = pdec.build_sections_epub('2024-12/02', client, {3})
+    client.close()
+    # 首页(即第1版版面页)之外只请求第3版的版面页和其中的文章页，包括末尾转载的头版第1篇
+    assert sorted(path.rsplit('/', 1)[1] for path in site.paths) == \
+        ['content_1001.html', 'content_3001.html', 'content_3002.html', 'content_3003.html', 'node_01.html',
+         'node_03.html']
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        chapters = sorted(name for name in zf.namelist() if re.fullmatch(r'EPUB/\d+_\d+\.xhtml', name))
+        # 文件名仍按原版次编号
+        assert chapters == ['EPUB/3_1.xhtml', 'EPUB/3_2.xhtml', 'EPUB/3_3.xhtml', 'EPUB/3_4.xhtml']
+        assert '第3版' in zf.read('EPUB/content.opf').decode('utf-8')